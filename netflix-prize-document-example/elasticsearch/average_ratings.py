@@ -0,0 +1,22 @@
+import sys
+
+from netflix_dal import get_average_ratings_of_movies
+
+if len(sys.argv) < 2:
+    print('Usage: average_ratings <movie_id> [<movie_id> ...]')
+    exit(1)
+
+movie_ids = sys.argv[1:]
+try:
+    # All of the averages come back from a single request.
+    result = get_average_ratings_of_movies(movie_ids)
+
+    for movie_id, (movie_count, average) in result.items():
+        if movie_count == 0:
+            print(f'There is no movie with ID {movie_id}.')
+        elif average is None:
+            print(f'The movie with ID {movie_id} has no ratings yet.')
+        else:
+            print(f'The average rating of movie ID {movie_id} is {average}.')
+except ValueError:
+    print(f'Sorry, something went wrong. Please ensure that “{" ".join(movie_ids)}” are all valid movie IDs.')
@@ -0,0 +1,31 @@
+import asyncio
+import sys
+
+from netflix_dal_async import close, gather_by_id, get_average_rating_of_movie
+
+if len(sys.argv) < 2:
+    print('Usage: average_ratings_async <movie_id> [<movie_id> ...]')
+    exit(1)
+
+
+async def main(movie_ids):
+    try:
+        # The averages are looked up concurrently, one request per movie.
+        return await gather_by_id(get_average_rating_of_movie, movie_ids)
+    finally:
+        await close()
+
+
+movie_ids = sys.argv[1:]
+try:
+    result = asyncio.run(main(movie_ids))
+
+    for movie_id, (movie_count, average) in result.items():
+        if movie_count == 0:
+            print(f'There is no movie with ID {movie_id}.')
+        elif average is None:
+            print(f'The movie with ID {movie_id} has no ratings yet.')
+        else:
+            print(f'The average rating of movie ID {movie_id} is {average}.')
+except ValueError:
+    print(f'Sorry, something went wrong. Please ensure that “{" ".join(movie_ids)}” are all valid movie IDs.')
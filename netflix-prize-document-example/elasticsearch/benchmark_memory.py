@@ -0,0 +1,98 @@
+"""
+This program measures how much memory rating_loader.py needs to turn one chunk of the source
+data into batches of *_bulk* actions, comparing three ways of doing it:
+
+- dicts: a list of {viewer_id, rating, date_rated} dictionaries per movie, passed to
+  json.dumps (how rating_loader.py used to do it)
+- text: the rating lines turned straight into JSON text, one action per movie (what
+  rating_loader.py does by default)
+- sliced: actions of at most N ratings each, for every N given with `--ratings-per-update`
+  (what `rating_loader.py --ratings-per-update N` does)
+
+Each chunk is measured on its own with Python’s `tracemalloc`, from reading its lines to
+having built every batch that the loader would send for it—with each batch dropped once it is
+complete, as if it had been sent. Only the movie updates are built, not the `ratings` index
+documents. The program reports the largest peak seen per approach, along with the chunk that
+caused it and the total time. For dicts and text, the peak follows the size of the most
+popular movie in the chunk; sliced, it follows N instead (plus the batch being built and the
+block of the file being read—see combined_data.py). Pass `--chunks N` to measure only the first N chunks of the
+source data rather than all of it.
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import time
+import tracemalloc
+
+from combined_data import DEFAULT_CHUNK_SIZE, SOURCES, find_chunks, read_movies
+from rating_loader import DEFAULT_BATCH_BYTES, INDEX_NAME, batches, bulk_actions
+
+DEFAULT_RATINGS_PER_UPDATE = [1000, 10000, 100000]
+
+
+def dict_actions(chunk):
+    for movie_id, rating_lines in read_movies(chunk):
+        ratings = []
+        for line in rating_lines:
+            viewer_id, rating, date_rated = line.split(',')
+            ratings.append({
+                'viewer_id': int(viewer_id),
+                'rating': int(rating),
+                'date_rated': date_rated
+            })
+
+        action = json.dumps({ 'update': { '_index': INDEX_NAME, '_id': str(movie_id) } })
+        document = json.dumps({ 'doc': { 'ratings': ratings } })
+        yield (movie_id, f'{action}\n{document}\n'.encode('utf-8'), True)
+
+
+def build_batches(actions, chunk):
+    count = 0
+    for batch in batches(actions(chunk), DEFAULT_BATCH_BYTES):
+        count = count + len(batch)
+
+    return count
+
+
+def measure(approach, chunks):
+    peak = (0, None)
+    start_time = time.perf_counter()
+    for source, start, end in chunks:
+        tracemalloc.start()
+        approach((source, start, end))
+        _, chunk_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = max(peak, (chunk_peak, f'{source} at {start}'))
+
+    return (peak, time.perf_counter() - start_time)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the peak memory of building rating updates with and without dictionaries and slicing.')
+    parser.add_argument('--chunks', type=int, default=0, metavar='N',
+        help='measure only the first N chunks of the source data (default: 0, meaning all of them)')
+    parser.add_argument('--ratings-per-update', type=int, nargs='+', default=DEFAULT_RATINGS_PER_UPDATE, metavar='N',
+        help=f'ratings per action for the sliced approach; several can be given (default: {DEFAULT_RATINGS_PER_UPDATE})')
+    args = parser.parse_args()
+
+    chunks = find_chunks(SOURCES, DEFAULT_CHUNK_SIZE)
+    if args.chunks > 0:
+        chunks = itertools.islice(chunks, args.chunks)
+
+    # Only the chunks’ positions are found up front; each approach reads the lines itself.
+    chunks = list(chunks)
+    approaches = {
+        'dicts': functools.partial(build_batches, dict_actions),
+        'text': functools.partial(build_batches, bulk_actions),
+        **{
+            f'sliced {size}': functools.partial(build_batches, functools.partial(bulk_actions, ratings_per_update=size))
+            for size in args.ratings_per_update
+        }
+    }
+
+    print(f'{len(chunks)} chunks')
+    for name, approach in approaches.items():
+        (peak, chunk), seconds = measure(approach, chunks)
+        print(f'{name:>13}: peak {peak / (1024 * 1024):.1f} MB (chunk {chunk}), {seconds:.1f}s')
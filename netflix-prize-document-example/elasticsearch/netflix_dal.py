@@ -1,97 +1,211 @@
+import base64
+import json
 import os
 
-from elasticsearch import Elasticsearch
-from elasticsearch_dsl import Search, Document
+from elasticsearch import Elasticsearch, NotFoundError
+from elasticsearch_dsl import Search, MultiSearch, Document
+
+from dal_cache import cached, invalidates
 
 
 es = Elasticsearch(hosts=[os.environ['ES_HOST']])
 MOVIES_INDEX = 'movies'
+RATINGS_INDEX = 'ratings'
 
 
-def search_movies_by_title(query, limit=100):
-    movie_search = Search(using=es, index=MOVIES_INDEX) \
+# Helper function for search_movies_by_title. Like the other functions here that build searches, this one is
+# shared with netflix_dal_async.py.
+def title_search(query, limit):
+    return Search(using=es, index=MOVIES_INDEX) \
         .query('match', title=query) \
         .sort('title.keyword')[:limit] # `size` is applied via list slicing.
 
-    response = movie_search.execute()
+
+# Title searches and averages are cached (see dal_cache.py), so repeated lookups of popular movies don’t go
+# back to Elasticsearch every time.
+@cached
+def search_movies_by_title(query, limit=100):
+    response = title_search(query, limit).execute()
     return response
 
 
-def get_average_rating_of_movie(movie_id):
+BUCKET_NAME = 'all_ratings'
+METRIC_NAME = 'average_rating'
+
+
+# Helper functions for get_average_rating_of_movie and get_average_ratings_of_movies.
+def average_rating_search(movie_id):
     average = Search(using=es, index=MOVIES_INDEX) \
         .query('match', _id=movie_id)
 
-    BUCKET_NAME = 'all_ratings'
-    METRIC_NAME = 'average_rating'
-
     # The `bucket` function nests succeeding aggregations.
     average.aggs \
         .bucket(BUCKET_NAME, 'nested', path='ratings') \
         .metric(METRIC_NAME, 'avg', field='ratings.rating')
 
-    response = average.execute()
+    return average
+
 
+def average_from_response(response):
     # In this database, it’s possible to have a movie with an empty ratings array.
     # Thus, we return a tuple to differentiate whether we got a movie with that ID.
     return (len(response), response.aggregations[BUCKET_NAME][METRIC_NAME]['value'])
 
 
-# Helper function for get_ratings_by_viewer.
+# rating_loader.py stores each movie’s rating count and sum in its document, so most of the time the average is just
+# a division away—no aggregation needed. Only those two fields are fetched, leaving the ratings array behind.
+STATS_FIELDS = ['rating_count', 'rating_sum']
+
+
+def average_from_stats(source):
+    return source['rating_sum'] / source['rating_count'] if source['rating_count'] > 0 else None
+
+
+# Gets the movie’s document by ID and computes the average from its statistics. Movies whose ratings were loaded
+# before the loader kept statistics fall back to the aggregation.
+@cached
+def get_average_rating_of_movie(movie_id):
+    try:
+        movie = es.get(index=MOVIES_INDEX, id=movie_id, _source_includes=STATS_FIELDS)
+    except NotFoundError:
+        return (0, None)
+
+    if 'rating_count' not in movie['_source']:
+        response = average_rating_search(movie_id).execute()
+        return average_from_response(response)
+
+    return (1, average_from_stats(movie['_source']))
+
+
+# Batch version of `get_average_rating_of_movie`, returning a dictionary from each given movie ID to the same kind
+# of tuple. Elasticsearch’s *_mget* endpoint gets any number of documents in one request, so this costs one round
+# trip no matter how many movies there are. Any movies without statistics are then aggregated together with one
+# *_msearch* request, which likewise takes any number of searches at once.
+def get_average_ratings_of_movies(movie_ids):
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return {}
+
+    response = es.mget(index=MOVIES_INDEX, body={ 'ids': movie_ids }, _source_includes=STATS_FIELDS)
+    result = {}
+    unsummarized = []
+    for movie_id, movie in zip(movie_ids, response['docs']):
+        if not movie.get('found'):
+            result[movie_id] = (0, None)
+        elif 'rating_count' not in movie['_source']:
+            unsummarized.append(movie_id)
+        else:
+            result[movie_id] = (1, average_from_stats(movie['_source']))
+
+    if unsummarized:
+        averages = MultiSearch(using=es, index=MOVIES_INDEX)
+        for movie_id in unsummarized:
+            averages = averages.add(average_rating_search(movie_id))
+
+        responses = averages.execute()
+        result.update({movie_id: average_from_response(response) for movie_id, response in zip(unsummarized, responses)})
+
+    return {movie_id: result[movie_id] for movie_id in movie_ids}
+
+
+# Helper function for get_ratings_by_viewer and get_ratings_by_viewers. Each hit is one rating from the `ratings`
+# index, which already has the fields we want.
 def rating_from_ratings_by_viewer_hit(hit):
-    # Note how this expression is _really_ dependent on the structure returned by the query in
-    # `get_ratings_by_viewer`.
-    rating = hit.meta.inner_hits['ratings'][0]
     return {
-        'date_rated': rating.date_rated,
+        'date_rated': hit.date_rated,
         'title': hit.title,
-        'rating': rating.rating
+        'rating': hit.rating
     }
 
 
-def get_ratings_by_viewer(viewer_id, limit=100):
-    ratings_search = Search(using=es, index=MOVIES_INDEX)
-
-    # This uses the `update_from_dict` technique—useful for cases where you’d rather not navigate
-    # the function calls due to the complexity of the query object.
-    ratings_search.update_from_dict({
-        '_source': {
-            'excludes': ['ratings']
-        },
-
-        'size': 100,
-        'query': {
-            'nested': {
-                'path': 'ratings',
-                'inner_hits': { },
-                'query': {
-                    'match': { 'ratings.viewer_id': viewer_id }
-                }
-            }
-        },
-
-        'sort': [
-            {
-                'ratings.date_rated': { # Sorts based on a nested object can be…involved.
-                    'order': 'asc',
-                    'nested': {
-                        'path': 'ratings',
-                        'filter': {
-                            # And yes, the filter does have to be repeated. See
-                            # /reference/current/sort-search-results.html#nested-sorting
-                            # in https://www.elastic.co/guide/en/elasticsearch
-                            'match': { 'ratings.viewer_id': viewer_id }
-                        }
-                    }
-                }
-            },
-            'title.keyword'
-        ]
-    })
+# Helper function for get_ratings_by_viewer and get_ratings_by_viewers.
+#
+# Rather than searching the `ratings` arrays nested in every movie, this searches the `ratings` index, which
+# rating_loader.py fills with one document per rating. Those documents are routed by viewer ID, so all of a viewer’s
+# ratings are on one shard—and passing the same `routing` here means that only that shard is asked. A `term` filter
+# on a plain field then finds them through the index alone, so the cost depends on how many movies the _viewer_ has
+# rated, no matter how many ratings those movies have.
+def ratings_by_viewer_search(viewer_id, limit, after=None):
+    ratings_search = Search(using=es, index=RATINGS_INDEX) \
+        .params(routing=viewer_id) \
+        .filter('term', viewer_id=viewer_id) \
+        .sort(
+            'date_rated',
+            'title',
+
+            # Breaks ties between same-titled movies rated on the same day, so that every rating has its own
+            # place in the order and paging (below) never skips or repeats one.
+            'movie_id'
+        )[:limit]
+
+    # `search_after` resumes the search right after the hit with the given sort values.
+    if after is not None:
+        ratings_search = ratings_search.extra(search_after=after)
+
+    return ratings_search
+
+
+# Helper functions for paging: a cursor is the position of the last rating on a page, encoded as an opaque string.
+# Callers just hand it back to get the next page.
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+
+# Returns one page of a viewer’s ratings along with a cursor for the next page, or `None` if this is the last page.
+#
+# Every hit comes back with the values it was sorted by (`hit.meta.sort`). The cursor holds those of the page’s last
+# hit, and the next page passes them as `search_after`, so Elasticsearch starts right after that hit. Unlike `from`,
+# which has to collect and discard every earlier hit, this costs about the same for deep pages as for the first.
+def get_ratings_page_by_viewer(viewer_id, limit=100, cursor=None):
+    # Asking for one more hit than the page holds tells us whether there is a next page.
+    response = ratings_page_search(viewer_id, limit, cursor).execute()
+    return ratings_page(response, limit)
+
+
+# Helper functions for get_ratings_page_by_viewer (and its netflix_dal_async.py counterpart).
+def ratings_page_search(viewer_id, limit, cursor):
+    after = decode_cursor(cursor) if cursor is not None else None
+    return ratings_by_viewer_search(viewer_id, limit + 1, after)
+
+
+def ratings_page(response, limit):
+    hits = list(response)
 
     # Here, we demonstrate the approach of restructuring the raw results into something
     # that will be simpler for the caller to use.
-    response = ratings_search.execute()
-    return [ rating_from_ratings_by_viewer_hit(hit) for hit in response ]
+    ratings = [ rating_from_ratings_by_viewer_hit(hit) for hit in hits[:limit] ]
+    if len(hits) <= limit:
+        return (ratings, None)
+
+    return (ratings, encode_cursor(list(hits[limit - 1].meta.sort)))
+
+
+# The first page of a viewer’s ratings.
+def get_ratings_by_viewer(viewer_id, limit=100):
+    ratings, _ = get_ratings_page_by_viewer(viewer_id, limit)
+    return ratings
+
+
+# Batch version of `get_ratings_by_viewer`, returning a dictionary from each given viewer ID to that viewer’s
+# ratings. Like `get_average_ratings_of_movies`, this sends all of the searches in one *_msearch* request.
+def get_ratings_by_viewers(viewer_ids, limit=100):
+    viewer_ids = list(viewer_ids)
+    if not viewer_ids:
+        return {}
+
+    ratings_searches = MultiSearch(using=es, index=RATINGS_INDEX)
+    for viewer_id in viewer_ids:
+        ratings_searches = ratings_searches.add(ratings_by_viewer_search(viewer_id, limit))
+
+    responses = ratings_searches.execute()
+    return {
+        viewer_id: [ rating_from_ratings_by_viewer_hit(hit) for hit in response ]
+        for viewer_id, response in zip(viewer_ids, responses)
+    }
 
 
 # For the document-centric version of `insert_movie`, we use an ORM-ish feature of the Elasticsearch DSL
@@ -109,7 +223,21 @@ class Movie(Document):
 
 # The original Netflix IDs are an artifact of Netflix’s system; here, ID generation switches
 # to how Elasticsearch does it, so IDs of newer movies will _not_ be integers.
+# A new movie can show up in title searches, so adding one empties the cached results.
+@invalidates(search_movies_by_title, get_average_rating_of_movie)
 def insert_movie(title, year):
-    movie = Movie(title=title, year=year)
+    movie = Movie(**new_movie_fields(title, year))
     movie.save()
-    return movie
\ No newline at end of file
+    return movie
+
+
+# A new movie starts out with no ratings, and statistics to match.
+def new_movie_fields(title, year):
+    return {
+        'title': title,
+        'year': year,
+        'ratings': [],
+        'rating_count': 0,
+        'rating_sum': 0,
+        'rating_histogram': [0, 0, 0, 0, 0]
+    }
\ No newline at end of file
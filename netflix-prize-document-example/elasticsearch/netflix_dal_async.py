@@ -0,0 +1,95 @@
+"""
+This module is the asyncio counterpart of netflix_dal.py: the same functions with the same results, but written as
+`async def` functions for programs that run on an event loop, such as an aiohttp web service. While one call waits
+for Elasticsearch, the loop is free to run others, so a single process can have thousands of lookups in flight
+without a thread for each.
+
+It runs on the Elasticsearch client’s asyncio version, `AsyncElasticsearch` (installed with
+`pip3 install elasticsearch[async]`), with the same `ES_HOST` variable as netflix_dal.py. The searches themselves are
+built by netflix_dal.py, so the two modules always ask the same questions.
+"""
+
+import asyncio
+import os
+
+from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch_dsl.response import Response
+
+import netflix_dal
+from dal_cache import cached, invalidates
+from netflix_dal import MOVIES_INDEX, RATINGS_INDEX, STATS_FIELDS, Movie, average_from_response, average_from_stats, \
+    average_rating_search, new_movie_fields, ratings_page, ratings_page_search, title_search
+
+es = AsyncElasticsearch(hosts=[os.environ['ES_HOST']])
+
+
+# A program should call this before its event loop ends, so that the client’s connections are closed properly.
+async def close():
+    await es.close()
+
+
+# Elasticsearch DSL searches execute synchronously, so this sends a search’s request through the asyncio client
+# instead, wrapping the result in the same kind of response that `search.execute()` returns.
+async def execute(search, index, **params):
+    return Response(search, await es.search(index=index, body=search.to_dict(), **params))
+
+
+# The cached functions use the same caches as their netflix_dal.py counterparts, which return the same results.
+# A program that uses both modules thus looks each result up only once, and `insert_movie` in either module
+# empties the caches for both.
+@cached(cache=netflix_dal.search_movies_by_title.cache)
+async def search_movies_by_title(query, limit=100):
+    return await execute(title_search(query, limit), MOVIES_INDEX)
+
+
+@cached(cache=netflix_dal.get_average_rating_of_movie.cache)
+async def get_average_rating_of_movie(movie_id):
+    try:
+        movie = await es.get(index=MOVIES_INDEX, id=movie_id, _source_includes=STATS_FIELDS)
+    except NotFoundError:
+        return (0, None)
+
+    if 'rating_count' not in movie['_source']:
+        response = await execute(average_rating_search(movie_id), MOVIES_INDEX)
+        return average_from_response(response)
+
+    return (1, average_from_stats(movie['_source']))
+
+
+async def get_ratings_page_by_viewer(viewer_id, limit=100, cursor=None):
+    response = await execute(ratings_page_search(viewer_id, limit, cursor), RATINGS_INDEX, routing=viewer_id)
+    return ratings_page(response, limit)
+
+
+async def get_ratings_by_viewer(viewer_id, limit=100):
+    ratings, _ = await get_ratings_page_by_viewer(viewer_id, limit)
+    return ratings
+
+
+# Returns a `Movie`, just like netflix_dal.py’s `insert_movie`, but saved through the asyncio client.
+@invalidates(search_movies_by_title, get_average_rating_of_movie)
+async def insert_movie(title, year):
+    fields = new_movie_fields(title, year)
+    response = await es.index(index=MOVIES_INDEX, body=fields)
+    return Movie(meta={ 'id': response['_id'] }, **fields)
+
+
+DEFAULT_CONCURRENCY = 100
+
+
+async def gather_by_id(function, ids, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Calls `function` (one of the functions above) for every ID in `ids`, concurrently, and returns a dictionary from
+    each ID to its result—for example, `await gather_by_id(get_average_rating_of_movie, movie_ids)`. No more than
+    `concurrency` calls are in progress at once, so that one large batch doesn’t open more connections to
+    Elasticsearch than it can usefully serve.
+    """
+    ids = list(ids)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(id):
+        async with semaphore:
+            return await function(id)
+
+    results = await asyncio.gather(*(call(id) for id in ids))
+    return dict(zip(ids, results))
@@ -1,69 +1,304 @@
-import csv
-import re
-
-import requests
-
 """
-This program builds payloads for requests that add ratings to movies.
+This program adds the combined_data ratings to the movies in Elasticsearch.
 
 The index of movies is assumed to be called `movies`.
+
+Every rating also becomes a document of its own in a second index, `ratings`, so that a
+viewer’s ratings can be found without searching through every movie’s ratings array. These
+documents are “routed” by viewer ID: Elasticsearch puts all of a viewer’s ratings on the same
+shard, so the DAL only needs to ask that one shard for them. Each one carries its movie’s
+title (from movie_titles.csv), so that the ratings can be sorted by title without a lookup.
+`--skip-ratings-index` leaves the `ratings` index alone.
+
+Each movie’s ratings go into its document as a partial update—an `update` action for the
+*_bulk* endpoint. Many such actions are sent together in each *_bulk* request, so there is one
+round trip per batch rather than one per movie:
+
+- Along with the ratings, each movie gets its rating statistics: `rating_count`,
+  `rating_sum`, and `rating_histogram` (how many 1s, 2s, … 5s). These let the DAL read a
+  movie’s average straight from its document, instead of aggregating over its ratings.
+- Batches are limited by size in bytes (`--batch-bytes`) rather than by number of movies,
+  since one movie can have a handful of ratings and another hundreds of thousands. (A movie
+  that is bigger than the limit all by itself goes in a batch of its own.)
+- The ratings go straight from the source lines into JSON text, with no dictionary per
+  rating in between—100 million small dictionaries cost far more memory and time than the
+  text they turn into.
+- `--ratings-per-update N` splits each movie’s ratings into updates of at most N ratings:
+  the first sets the movie’s ratings, and the rest _append_ to them with a small script, which
+  also adds their counts to the movie’s statistics. No single action then gets huge—the most
+  popular movies have over 200,000 ratings—and each update is made as soon as its N rating
+  lines have been read (see `read_movie_slices` in combined_data.py), so no more than N
+  ratings of any movie are in memory at once.
+- Each process sends its requests through a single `requests.Session`, which keeps its
+  connections to Elasticsearch open from one request to the next.
+- When Elasticsearch is too busy, it answers with status 429 (“Too Many Requests”), either
+  for a whole request or for some of the actions within it. Those are sent again after a
+  pause that doubles with every retry—so a busy server slows the loader down instead of
+  failing it. Since each process waits for its current request before sending another, the
+  number of requests in flight never exceeds the number of workers.
+- `--fast` turns off the indexes’ periodic refresh and their replicas for the duration of
+  the load, so that Elasticsearch only does the work of indexing each document once. The
+  previous settings are put back (and the indexes refreshed) when the load ends, even if it
+  fails.
+
+The Elasticsearch URL can be changed with `--url`—for example, to point the loader at a stub
+server for testing.
 """
 
-# For simplicity, we assume that the program runs where the files are located.
-RATING_SOURCES = [
-    'combined_data_1.txt',
-    'combined_data_2.txt',
-    'combined_data_3.txt',
-    'combined_data_4.txt'
-]
+import argparse
+import functools
+import json
+import time
 
-# The all-important pattern indicating the current movie.
-MOVIE_LINE_PATTERN = '^(\d+):$'
-MOVIE_LINE = re.compile(MOVIE_LINE_PATTERN)
+import requests
 
-# Elasticsearch index name.
+from combined_data import add_workers_argument, map_chunks, read_movie_slices, read_movies
+from movie_loader import movie_titles
+
+# Elasticsearch index names.
 INDEX_NAME = 'movies'
+RATINGS_INDEX_NAME = 'ratings'
+
+DEFAULT_URL = 'http://localhost:9200'
+DEFAULT_BATCH_BYTES = 10 * 1024 * 1024
+
+# How many times a request (or action) is sent before giving up on it, and how long to wait
+# before the first retry.
+MAX_ATTEMPTS = 8
+FIRST_RETRY_DELAY = 0.5
+
+# Each process keeps one session, created on first use. (It must not be created before the
+# worker processes start, or they would all share—and garble—the same connections.)
+session = None
+
+
+def get_session():
+    global session
+    if session is None:
+        session = requests.Session()
+
+    return session
+
+
+# Ratings go from 1 to 5, so a histogram is a list of 5 counts.
+RATING_VALUES = 5
+
+# The (painless) script for updates that append to a movie’s ratings. The statistics of the
+# appended ratings are added to the movie’s, so they stay correct however the ratings arrive.
+APPEND_SCRIPT = ' '.join([
+    'ctx._source.ratings.addAll(params.ratings);',
+    'ctx._source.rating_count += params.rating_count;',
+    'ctx._source.rating_sum += params.rating_sum;',
+    'for (int i = 0; i < params.rating_histogram.size(); i++) {',
+    'ctx._source.rating_histogram[i] += params.rating_histogram[i];',
+    '}'
+])
+
+
+# Turns rating lines into the JSON text of an array of ratings, along with the histogram of
+# those ratings. The text is what json.dumps would produce from a list of {viewer_id, rating,
+# date_rated} dictionaries, minus the dictionaries.
+def ratings_json(rating_lines):
+    ratings = []
+    histogram = [0] * RATING_VALUES
+    for line in rating_lines:
+        viewer_id, rating, date_rated = line.split(',')
+        ratings.append(f'{{"viewer_id": {int(viewer_id)}, "rating": {int(rating)}, "date_rated": "{date_rated}"}}')
+        histogram[int(rating) - 1] += 1
+
+    return (f'[{", ".join(ratings)}]', histogram)
+
+
+# The JSON fields for the statistics of the ratings with the given histogram.
+def stats_json(histogram):
+    count = sum(histogram)
+    total = sum(value * rating_count for value, rating_count in enumerate(histogram, start=1))
+    return f'"rating_count": {count}, "rating_sum": {total}, "rating_histogram": {json.dumps(histogram)}'
+
+
+# The *_bulk* action that sets (`replaces`) or appends to one movie’s ratings, as a
+# (movie_id, bytes, replaces) tuple. An action is two lines: what to do, and the partial
+# document or script.
+def movie_action(movie_id, rating_lines, replaces):
+    action = json.dumps({ 'update': { '_index': INDEX_NAME, '_id': str(movie_id) } })
+    ratings, histogram = ratings_json(rating_lines)
+    fields = f'"ratings": {ratings}, {stats_json(histogram)}'
+    if replaces:
+        document = f'{{"doc": {{{fields}}}}}'
+    else:
+        document = f'{{"script": {{"source": "{APPEND_SCRIPT}", "params": {{{fields}}}}}}}'
+
+    return (movie_id, f'{action}\n{document}\n'.encode('utf-8'), replaces)
+
+
+# Yields the *_bulk* actions that add one movie’s ratings to the `ratings` index, one document
+# per rating, in the same tuples as `movie_action`. The document IDs combine the movie and
+# viewer, so loading the same rating again replaces it rather than adding a duplicate.
+def rating_document_actions(movie_id, title, rating_lines):
+    title = json.dumps(title, ensure_ascii=False)
+    for line in rating_lines:
+        viewer_id, rating, date_rated = line.split(',')
+        action = f'{{"index": {{"_index": "{RATINGS_INDEX_NAME}", "_id": "{movie_id}-{viewer_id}", "routing": "{viewer_id}"}}}}'
+        document = f'{{"viewer_id": {int(viewer_id)}, "movie_id": "{movie_id}", "title": {title}, "rating": {int(rating)}, "date_rated": "{date_rated}"}}'
+        yield (movie_id, f'{action}\n{document}\n'.encode('utf-8'), False)
+
+
+# Yields the actions for every movie in the given chunk. `titles` maps movie IDs to titles,
+# or is None to leave out the `ratings` index. With `ratings_per_update`, each slice of a
+# movie’s ratings is turned into actions as soon as it has been read; the first slice replaces
+# the movie’s ratings, and the rest append to them.
+def bulk_actions(chunk, ratings_per_update=0, titles=None):
+    if ratings_per_update > 0:
+        slices = read_movie_slices(chunk, ratings_per_update)
+    else:
+        slices = ((movie_id, 0, rating_lines) for movie_id, rating_lines in read_movies(chunk))
+
+    for movie_id, slice_number, rating_lines in slices:
+        yield movie_action(movie_id, rating_lines, slice_number == 0)
+        if titles is not None:
+            yield from rating_document_actions(movie_id, titles.get(str(movie_id)), rating_lines)
+
+
+# Groups actions into lists whose combined size stays within `max_bytes`.
+def batches(actions, max_bytes):
+    batch = []
+    size = 0
+    for movie_id, action, replaces in actions:
+        if batch and size + len(action) > max_bytes:
+            yield batch
+            batch = []
+            size = 0
+
+        batch.append((movie_id, action, replaces))
+        size = size + len(action)
+
+    if batch:
+        yield batch
+
+
+# Sends one batch to *_bulk*, retrying whatever Elasticsearch turns away with a 429. The
+# feedback is returned rather than printed so that it shows up in order even when chunks are
+# being loaded by several processes.
+def send_batch(url, batch):
+    feedback = []
+    delay = FIRST_RETRY_DELAY
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt > 0:
+            time.sleep(delay)
+            delay = delay * 2
+
+        response = get_session().post(
+            f'{url}/_bulk',
+            data=b''.join(action for _, action, _ in batch),
+            headers={ 'Content-Type': 'application/x-ndjson' })
+
+        # The whole request was turned away, so all of it will be retried.
+        if response.status_code == 429:
+            continue
+
+        if response.status_code != 200:
+            feedback.extend(f'{movie_id}: {response.status_code}\n{response.text}' for movie_id, _, _ in batch)
+            return feedback
+
+        # Otherwise, every action has its own result, in the same order as the actions and
+        # under the action’s name (`update` or `index`). If an action that replaces a movie’s
+        # ratings has to be retried, then so do the actions for that movie which came after
+        # it—the retried replacement will wipe out any appends.
+        retry = []
+        replaced_again = set()
+        for (movie_id, action, replaces), item in zip(batch, response.json()['items']):
+            kind, result = next(iter(item.items()))
+            if result['status'] == 429 or movie_id in replaced_again:
+                if replaces:
+                    replaced_again.add(movie_id)
+
+                retry.append((movie_id, action, replaces))
+                continue
+
+            # Provide some feedback: a line per movie update, but only the failures among the
+            # (many) rating documents.
+            succeeded = result['status'] in (200, 201)
+            if kind == 'update' or not succeeded:
+                feedback.append(f'{movie_id}: {result["status"]}')
+
+            if not succeeded:
+                feedback.append(f'{result.get("error")}')
+
+        if not retry:
+            return feedback
+
+        batch = retry
+
+    feedback.extend(f'{movie_id}: 429 (gave up after {MAX_ATTEMPTS} attempts)' for movie_id, _, _ in batch)
+    return feedback
+
+
+# Every chunk starts on a movie line, so a chunk always holds complete movies and can be
+# loaded independently of the others.
+def process_chunk(url, batch_bytes, ratings_per_update, titles, chunk):
+    feedback = []
+    for batch in batches(bulk_actions(chunk, ratings_per_update, titles), batch_bytes):
+        feedback.extend(send_batch(url, batch))
+
+    return feedback
+
+
+# Helper functions for `--fast`. These run in the main process, with one-off requests.
+def index_settings_url(url, index):
+    return f'{url}/{index}/_settings'
+
+
+def speed_up_index(url, index):
+    """
+    Turns off refresh and replicas on the index, returning the settings to restore afterwards.
+    A setting that was never changed comes back as None, which resets it to its default.
+    """
+    response = requests.get(index_settings_url(url, index))
+    response.raise_for_status()
+    settings = response.json()[index]['settings']['index']
+    previous = {
+        'refresh_interval': settings.get('refresh_interval'),
+        'number_of_replicas': settings.get('number_of_replicas')
+    }
+
+    requests.put(index_settings_url(url, index),
+        json={ 'index': { 'refresh_interval': '-1', 'number_of_replicas': 0 } }).raise_for_status()
+    return previous
+
+
+def restore_index(url, index, previous):
+    requests.put(index_settings_url(url, index), json={ 'index': previous }).raise_for_status()
+    requests.post(f'{url}/{index}/_refresh').raise_for_status()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=f'Adds the combined_data ratings to the {INDEX_NAME} index.')
+    parser.add_argument('--url', default=DEFAULT_URL, help=f'Elasticsearch URL (default: {DEFAULT_URL})')
+    parser.add_argument('--batch-bytes', type=int, default=DEFAULT_BATCH_BYTES, metavar='BYTES',
+        help=f'most bytes of actions per _bulk request (default: {DEFAULT_BATCH_BYTES})')
+    parser.add_argument('--ratings-per-update', type=int, default=0, metavar='N',
+        help='split each movie’s ratings into updates of at most N ratings (default: 0, meaning one update per movie)')
+    parser.add_argument('--skip-ratings-index', action='store_true',
+        help=f'only update the {INDEX_NAME} index, leaving out the {RATINGS_INDEX_NAME} index')
+    parser.add_argument('--fast', action='store_true',
+        help='turn off index refresh and replicas during the load, restoring them afterwards')
+    add_workers_argument(parser)
+    args = parser.parse_args()
+
+    indexes = [INDEX_NAME] if args.skip_ratings_index else [INDEX_NAME, RATINGS_INDEX_NAME]
+    titles = None if args.skip_ratings_index else { id: title for id, _, title in movie_titles() }
 
+    # Settings are only changed (and so, restored) for the indexes that were sped up before a failure.
+    previous_settings = {}
+    try:
+        if args.fast:
+            for index in indexes:
+                previous_settings[index] = speed_up_index(args.url, index)
 
-# Helper function for sending movie updates.
-def update_ratings(movie_id, ratings):
-    response = requests.post(
-        f'http://localhost:9200/{INDEX_NAME}/_update/{movie_id}',
-        json={ 'doc': { 'ratings': ratings } })
-
-    # Provide some feedback.
-    print(f'{movie_id}: {response.status_code}')
-    if (response.status_code != 200):
-        print(response.json())
-
-
-current_movie_id = None
-current_ratings = []
-
-# Read the files line by line and accumulate them into arrays for the current movie ID.
-for ratings_file in RATING_SOURCES:
-    with open(ratings_file, 'r+') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            movie_match = MOVIE_LINE.match(row[0])
-            if movie_match:
-                # We’re done with a movie, so time to POST.
-                if current_movie_id is not None:
-                    update_ratings(current_movie_id, current_ratings)
-
-                # Set the new movie ID and start a new list of ratings.
-                current_movie_id = movie_match.group(1)
-                current_ratings = []
-            else:
-                # Add a rating to the current array.
-                viewer_id = int(row[0])
-                rating = int(row[1])
-                date_rated = row[2]
-                current_ratings.append({
-                    'viewer_id': viewer_id,
-                    'rating': rating,
-                    'date_rated': date_rated
-                })
-
-# We need to end the very last movie update statement.
-update_ratings(current_movie_id, current_ratings)
+        process = functools.partial(process_chunk, args.url, args.batch_bytes, args.ratings_per_update, titles)
+        for feedback in map_chunks(process, args.workers):
+            for line in feedback:
+                print(line)
+    finally:
+        for index, previous in previous_settings.items():
+            restore_index(args.url, index, previous)
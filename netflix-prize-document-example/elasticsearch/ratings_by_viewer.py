@@ -1,13 +1,14 @@
 import sys
-from netflix_dal import get_ratings_by_viewer
+from netflix_dal import get_ratings_page_by_viewer
 
-if len(sys.argv) != 2:
-    print('Usage: ratings_by_viewer <viewer_id>')
+if len(sys.argv) not in (2, 3):
+    print('Usage: ratings_by_viewer <viewer_id> [<cursor>]')
     exit(1)
 
 viewer_id = sys.argv[1]
+cursor = sys.argv[2] if len(sys.argv) == 3 else None
 try:
-    result = get_ratings_by_viewer(int(viewer_id))
+    result, next_cursor = get_ratings_page_by_viewer(int(viewer_id), cursor=cursor)
 
     if len(result) == 0:
         print(f'The viewer {viewer_id} does not have any ratings in the database.')
@@ -15,5 +16,8 @@ try:
 
     for rating_hit in result:
         print(f"{rating_hit['date_rated']}: “{rating_hit['title']}” got a {rating_hit['rating']}.")
+
+    if next_cursor is not None:
+        print(f'For more, run: ratings_by_viewer {viewer_id} {next_cursor}')
 except ValueError:
-    print(f'Sorry, something went wrong. Please ensure that “{viewer_id}” is a valid viewer ID.')
+    print(f'Sorry, something went wrong. Please ensure that “{viewer_id}” is a valid viewer ID (and that the cursor, if any, is unaltered).')
@@ -0,0 +1,22 @@
+import sys
+from netflix_dal import get_ratings_by_viewers
+
+if len(sys.argv) < 2:
+    print('Usage: ratings_by_viewers <viewer_id> [<viewer_id> ...]')
+    exit(1)
+
+viewer_ids = sys.argv[1:]
+try:
+    # All of the viewers’ ratings come back from a single request.
+    result = get_ratings_by_viewers([int(viewer_id) for viewer_id in viewer_ids])
+
+    for viewer_id, ratings in result.items():
+        if len(ratings) == 0:
+            print(f'The viewer {viewer_id} does not have any ratings in the database.')
+            continue
+
+        print(f'Viewer {viewer_id}:')
+        for rating_hit in ratings:
+            print(f"  {rating_hit['date_rated']}: “{rating_hit['title']}” got a {rating_hit['rating']}.")
+except ValueError:
+    print(f'Sorry, something went wrong. Please ensure that “{" ".join(viewer_ids)}” are all valid viewer IDs.')
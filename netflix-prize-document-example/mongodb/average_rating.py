@@ -0,0 +1,16 @@
+import sys
+
+from netflix_dal import get_average_rating_of_movie
+
+if len(sys.argv) != 2:
+    print('Usage: average_rating <movie_id>')
+    exit(1)
+
+movie_id = sys.argv[1]
+result = get_average_rating_of_movie(movie_id)
+
+if result is None:
+    print(f'The movie with ID {movie_id} either does not exist or has no ratings yet.')
+    exit(0)
+
+print(f'The average rating of movie ID {movie_id} is {result}.')
@@ -0,0 +1,89 @@
+"""
+This program measures how much memory rating_loader.py needs to turn one chunk of the source
+data into document text, comparing three ways of doing it:
+
+- dicts: a list of {viewer_id, rating, date_rated} dictionaries per movie, passed to
+  json.dumps (how rating_loader.py used to do it)
+- text: the rating lines turned straight into JSON text, one document per movie (what
+  rating_loader.py does by default)
+- buckets: bucket documents of at most N ratings each, for every N given with
+  `--bucket-size` (what `rating_loader.py --bucket-size N` does)
+
+Each chunk is measured on its own with Python’s `tracemalloc`, from reading its lines to
+writing its documents out (to the null device, here). The program reports the largest peak
+seen per approach, along with the chunk that caused it and the total time. For dicts and
+text, the peak follows the size of the most popular movie in the chunk; for buckets, it
+follows N instead (plus the block of the file being read—see combined_data.py). Pass
+`--chunks N` to measure only the first N chunks of the source data rather than all of it.
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import os
+import time
+import tracemalloc
+
+from combined_data import DEFAULT_CHUNK_SIZE, SOURCES, find_chunks, read_movies
+from rating_loader import chunk_documents
+
+DEFAULT_BUCKET_SIZES = [1000, 10000, 100000]
+
+
+def dict_documents(chunk):
+    for movie_id, rating_lines in read_movies(chunk):
+        ratings = []
+        for line in rating_lines:
+            viewer_id, rating, date_rated = line.split(',')
+            ratings.append({
+                'viewer_id': int(viewer_id),
+                'rating': int(rating),
+                'date_rated': date_rated
+            })
+
+        yield json.dumps({ 'id': str(movie_id), 'ratings': ratings }) + '\n'
+
+
+def write_documents(documents, chunk):
+    with open(os.devnull, 'w') as f:
+        f.writelines(documents(chunk))
+
+
+def measure(approach, chunks):
+    peak = (0, None)
+    start_time = time.perf_counter()
+    for source, start, end in chunks:
+        tracemalloc.start()
+        approach((source, start, end))
+        _, chunk_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = max(peak, (chunk_peak, f'{source} at {start}'))
+
+    return (peak, time.perf_counter() - start_time)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the peak memory of building rating documents with and without dictionaries and buckets.')
+    parser.add_argument('--chunks', type=int, default=0, metavar='N',
+        help='measure only the first N chunks of the source data (default: 0, meaning all of them)')
+    parser.add_argument('--bucket-size', type=int, nargs='+', default=DEFAULT_BUCKET_SIZES, metavar='N',
+        help=f'ratings per bucket for the buckets approach; several sizes can be given (default: {DEFAULT_BUCKET_SIZES})')
+    args = parser.parse_args()
+
+    chunks = find_chunks(SOURCES, DEFAULT_CHUNK_SIZE)
+    if args.chunks > 0:
+        chunks = itertools.islice(chunks, args.chunks)
+
+    # Only the chunks’ positions are found up front; each approach reads the lines itself.
+    chunks = list(chunks)
+    approaches = {
+        'dicts': dict_documents,
+        'text': functools.partial(chunk_documents, 0),
+        **{f'buckets {size}': functools.partial(chunk_documents, size) for size in args.bucket_size}
+    }
+
+    print(f'{len(chunks)} chunks')
+    for name, documents in approaches.items():
+        (peak, chunk), seconds = measure(functools.partial(write_documents, documents), chunks)
+        print(f'{name:>14}: peak {peak / (1024 * 1024):.1f} MB (chunk {chunk}), {seconds:.1f}s')
@@ -0,0 +1,10 @@
+import time
+
+from netflix_dal import create_indexes
+
+# Building the indexes reads every rating in the database, so this can take a while. Run it once after loading with
+# mongoimport (direct_loader.py creates the movie indexes itself).
+start = time.perf_counter()
+for name in create_indexes():
+    print(f'Created index {name}, {time.perf_counter() - start:.1f}s')
+    start = time.perf_counter()
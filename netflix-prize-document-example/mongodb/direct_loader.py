@@ -0,0 +1,169 @@
+"""
+This program loads the Netflix Prize movies _and_ their ratings directly into MongoDB, in
+one pass, instead of piping rating_loader.py into `mongoimport` and then movie_loader.py into
+`mongo`. It connects with the same `DB_URL` environment variable as the DAL:
+
+    DB_URL=mongodb://localhost python3 direct_loader.py --drop --workers 4 --threads 8
+
+The two-step load writes every movie document twice—first with its ratings, then again when
+`updateOne` sets its year and title (MongoDB rewrites the whole document, ratings and all,
+when it grows)—and sends the 17,770 updates one command at a time. Here, each movie’s title
+and year are merged into its document _before_ it is written, so every document is written
+exactly once:
+
+- The combined_data files are read in chunks that each start on a movie line (see
+  combined_data.py), by `--workers` processes. Each process turns its chunk into finished
+  movie documents, already encoded as BSON (MongoDB’s binary format for documents) so that
+  they pass back to the main process as compact bytes.
+- The main process groups the documents into batches of around `--batch-bytes` and hands
+  them to `--threads` writer threads, which send them with unordered `insert_many` calls—
+  unordered, so that MongoDB is free to write each batch’s documents in whatever order is
+  fastest. The threads share one `MongoClient`, whose connection pool holds a connection per
+  thread. No more than two batches per thread wait at a time, so memory stays bounded even
+  when the database is slower than the readers.
+- Indexes on `id` and `ratings.viewer_id` are created _after_ the load, which is much faster
+  than keeping them up to date one document at a time.
+
+`--drop` drops the collection first, like `mongoimport --drop`. Without it, loading into a
+collection that already has the movies leaves each of them in there twice.
+
+Every document must stay under MongoDB’s 16-megabyte limit; the most popular movies, at a
+little over 200,000 ratings, come to about 12 megabytes.
+"""
+
+import argparse
+import functools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import bson
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient
+
+from combined_data import add_workers_argument, map_chunks, rating_columns, read_movies
+from movie_loader import COLLECTION_NAME, DB_NAME, movie_titles
+from netflix_dal import INDEXES as DAL_INDEXES, MOVIE_COLLECTION
+
+DEFAULT_BATCH_BYTES = 8 * 1024 * 1024
+DEFAULT_THREADS = 4
+
+# The indexes to create once the documents are in come from the DAL (netflix_dal.py), so that
+# they are always the ones that its queries rely on.
+INDEXES = DAL_INDEXES[MOVIE_COLLECTION]
+
+
+# The document for one movie, in the same shape that the two-step load produces. A movie that
+# is missing from movie_titles.csv simply has no year or title.
+def movie_document(movie_id, title, ratings):
+    document = { 'id': movie_id }
+    if title is not None:
+        document['year'], document['title'] = title
+
+    if ratings is not None:
+        document['ratings'] = ratings
+
+    return document
+
+
+# Every chunk starts on a movie line, so a chunk always holds complete movies. Each one is
+# turned into its BSON-encoded document; the movie IDs come along so that the main process
+# knows which titles have been used.
+def process_chunk(titles, chunk):
+    movie_ids = []
+    documents = []
+    for movie_id, rating_lines in read_movies(chunk):
+        # Movie IDs have always been strings in these documents, so we keep them that way.
+        movie_id = str(movie_id)
+        viewer_ids, ratings, dates = rating_columns(rating_lines)
+        rating_documents = [
+            { 'viewer_id': viewer_id, 'rating': rating, 'date_rated': date_rated }
+            for viewer_id, rating, date_rated in zip(viewer_ids, ratings, dates)
+        ]
+
+        movie_ids.append(movie_id)
+        documents.append(bson.encode(movie_document(movie_id, titles.get(movie_id), rating_documents)))
+
+    return (movie_ids, documents)
+
+
+# Groups documents into lists whose combined size stays within `max_bytes`.
+def batches(documents, max_bytes):
+    batch = []
+    size = 0
+    for document in documents:
+        if batch and size + len(document) > max_bytes:
+            yield batch
+            batch = []
+            size = 0
+
+        batch.append(document)
+        size = size + len(document)
+
+    if batch:
+        yield batch
+
+
+# Runs in a writer thread. The documents are already BSON, so pymongo sends them as they are.
+def insert_batch(collection, batch):
+    collection.insert_many([RawBSONDocument(document) for document in batch], ordered=False)
+    return len(batch)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Loads the movies and their ratings directly into MongoDB at DB_URL.')
+    parser.add_argument('--drop', action='store_true', help=f'drop the {COLLECTION_NAME} collection first')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, metavar='N',
+        help=f'number of threads writing to the database (default: {DEFAULT_THREADS})')
+    parser.add_argument('--batch-bytes', type=int, default=DEFAULT_BATCH_BYTES, metavar='BYTES',
+        help=f'most bytes of documents per insert_many call (default: {DEFAULT_BATCH_BYTES})')
+    add_workers_argument(parser)
+    args = parser.parse_args()
+
+    threads = max(args.threads, 1)
+    client = MongoClient(os.environ['DB_URL'], maxPoolSize=threads)
+    collection = client[DB_NAME][COLLECTION_NAME]
+    if args.drop:
+        collection.drop()
+
+    titles = { id: (year, title) for id, year, title in movie_titles() }
+    unrated = set(titles)
+    load_start = time.perf_counter()
+    loaded = 0
+
+    def finish(futures):
+        global loaded
+        for future in futures:
+            # result() raises whatever the insert raised, which stops the load.
+            loaded = loaded + future.result()
+
+        print(f'{loaded} movies loaded, {time.perf_counter() - load_start:.1f}s')
+
+    pending = set()
+    with ThreadPoolExecutor(threads) as executor:
+        def submit(batch):
+            global pending
+            if len(pending) >= 2 * threads:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                finish(done)
+
+            pending.add(executor.submit(insert_batch, collection, batch))
+
+        for movie_ids, documents in map_chunks(functools.partial(process_chunk, titles), args.workers):
+            unrated.difference_update(movie_ids)
+            for batch in batches(documents, args.batch_bytes):
+                submit(batch)
+
+        # Movies that have a title but no ratings still get documents.
+        leftovers = (bson.encode(movie_document(id, titles[id], None)) for id in sorted(unrated, key=int))
+        for batch in batches(leftovers, args.batch_bytes):
+            submit(batch)
+
+        finish(pending)
+
+    for keys, options in INDEXES:
+        index_start = time.perf_counter()
+        name = collection.create_index(keys, **options)
+        print(f'Created index {name}, {time.perf_counter() - index_start:.1f}s')
+
+    print(f'Loaded {loaded} movies in {time.perf_counter() - load_start:.1f}s.')
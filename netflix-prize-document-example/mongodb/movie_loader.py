@@ -1,14 +1,18 @@
-import csv
-import json
-
 """
 This program generates direct `mongo` commands from the source Netflix Prize files in order
 to set titles and years for a MongoDB database _with movie ratings already loaded_.
 
+Each update is an _upsert_, so a movie that doesn’t have a document yet gets one. That is
+always the case when the ratings were loaded as buckets (`rating_loader.py --bucket-size`),
+which go in a collection of their own.
+
 The database is assumed to be called `netflix` and the collection of movies is assumed to
 be called `movies`.
 """
 
+import csv
+import json
+
 # For simplicity, we assume that the program runs where the files are located.
 MOVIE_SOURCE = 'movie_titles.csv'
 
@@ -29,18 +33,26 @@ def print_movie_update(id, year, title):
 
     print(f'db.{COLLECTION_NAME}.updateOne(')
     print(f"  {json.dumps({ 'id': id })},")
-    print(f"  {json.dumps(set_argument, ensure_ascii=False)}") # ensure_ascii=False forces UTF-8 encoding.
+    print(f"  {json.dumps(set_argument, ensure_ascii=False)},") # ensure_ascii=False forces UTF-8 encoding.
+    print(f"  {json.dumps({ 'upsert': True })}")
     print(f')')
 
 
-# Start by making `mongo` use the given database name.
-print(f'use {DB_NAME}')
+# Yields (id, year, title) for every movie in the source file. The ID stays a string, as it
+# is in the documents.
+def movie_titles():
+    with open(MOVIE_SOURCE, 'r+', encoding='iso-8859-1') as f:
+        reader = csv.reader(f)
+        for row in reader:
+            id = row[0]
+            year = None if row[1] == 'NULL' else int(row[1])
+            title = ', '.join(row[2:])
+            yield (id, year, title)
+
 
+if __name__ == '__main__':
+    # Start by making `mongo` use the given database name.
+    print(f'use {DB_NAME}')
 
-with open(MOVIE_SOURCE, 'r+', encoding='iso-8859-1') as f:
-    reader = csv.reader(f)
-    for row in reader:
-        id = row[0]
-        year = None if row[1] == 'NULL' else int(row[1])
-        title = ', '.join(row[2:])
+    for id, year, title in movie_titles():
         print_movie_update(id, year, title)
@@ -0,0 +1,194 @@
+import os
+import re
+import threading
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, MongoClient
+
+from dal_cache import cached, invalidates
+
+
+# As in netflix-dal.mjs, the MongoDB client is called `db` to provide an analogy across the various DAL examples.
+# A MongoClient keeps a pool of connections and connects lazily, so one client serves the whole program.
+db = MongoClient(os.environ['DB_URL'])
+
+DB_NAME = 'netflix'
+MOVIE_COLLECTION = 'movies'
+BUCKET_COLLECTION = 'rating_buckets'
+
+
+# Helper functions for accessing the `movies` collection and, for databases whose ratings were loaded with
+# `rating_loader.py --bucket-size`, the `rating_buckets` collection.
+def movies_collection():
+    return db[DB_NAME][MOVIE_COLLECTION]
+
+
+def buckets_collection():
+    return db[DB_NAME][BUCKET_COLLECTION]
+
+
+# The indexes that the DAL’s queries rely on, by collection, as (keys, options)—direct_loader.py creates the movie
+# ones after its load. `ratings.viewer_id` indexes a field _inside_ an array, which makes it a “multikey” index: every
+# rating in a movie’s (or bucket’s) array gets an entry pointing back to that document. That lets
+# `get_ratings_by_viewer` go straight to the movies that a viewer has rated instead of looking inside every one.
+INDEXES = {
+    MOVIE_COLLECTION: [
+        ([('id', ASCENDING)], {}),
+        ([('ratings.viewer_id', ASCENDING)], {})
+    ],
+    BUCKET_COLLECTION: [
+        ([('movie_id', ASCENDING), ('bucket', ASCENDING)], {}),
+        ([('ratings.viewer_id', ASCENDING)], {})
+    ]
+}
+
+
+# Creates the indexes, for databases that were loaded with _mongoimport_ (see create_indexes.py). Building an index
+# over 100 million ratings takes a while, so this is a setup step to run once after loading, rather than something
+# that the DAL functions do the first time they are called—that would hold up whichever request came first. Creating
+# an index that already exists does nothing. Yields the name of each index as it is made.
+def create_indexes():
+    collections = [MOVIE_COLLECTION] + ([BUCKET_COLLECTION] if uses_buckets() else [])
+    for collection in collections:
+        for keys, options in INDEXES[collection]:
+            yield db[DB_NAME][collection].create_index(keys, **options)
+
+
+rating_layout = {}
+rating_layout_lock = threading.Lock()
+
+
+# Tells whether the ratings are in the `rating_buckets` collection rather than inside the movie documents. The
+# answer is looked up once per process: it only changes when the database is reloaded.
+def uses_buckets():
+    with rating_layout_lock:
+        if 'buckets' not in rating_layout:
+            rating_layout['buckets'] = BUCKET_COLLECTION in db[DB_NAME].list_collection_names()
+
+        return rating_layout['buckets']
+
+
+# Title searches and averages are cached (see dal_cache.py), so repeated lookups of popular movies don’t go
+# back to MongoDB every time.
+@cached
+def search_movies_by_title(query, limit=100):
+    # Listing the fields that we want (a _projection_) leaves out everything else—most importantly, the ratings, which
+    # can run to megabytes per movie. The query is escaped so that characters like `(` or `?` match themselves.
+    cursor = movies_collection() \
+        .find({ 'title': { '$regex': re.escape(query), '$options': 'i' } }, { 'id': 1, 'year': 1, 'title': 1 }) \
+        .sort('title', ASCENDING) \
+        .limit(limit)
+
+    return list(cursor)
+
+
+# Because newly-added movies won’t have Netflix’s legacy ID, we need to look for both Netflix legacy ID matches and
+# native MongoDB object ID matches.
+def movie_filter(movie_id):
+    conditions = [{ 'id': str(movie_id) }]
+    try:
+        conditions.append({ '_id': ObjectId(movie_id) })
+    except (InvalidId, TypeError):
+        pass
+
+    return { '$or': conditions }
+
+
+# The average is computed by MongoDB, and only the average comes back. netflix-dal.mjs does this by `$unwind`-ing the
+# ratings—which turns a popular movie into 200,000 little documents—then `$group`-ing them back together. Here, `$avg`
+# works on the ratings array directly, within the one document. A non-existent (or unrated) movie yields `None`.
+#
+# With buckets, the movie’s ratings are spread over several documents, so each bucket’s sum and size are added up
+# instead. Buckets only exist for movies from the Netflix data, which is where they get their ratings from.
+@cached
+def get_average_rating_of_movie(movie_id):
+    if uses_buckets():
+        result = list(buckets_collection().aggregate([
+            { '$match': { 'movie_id': str(movie_id) } },
+            {
+                '$group': {
+                    '_id': None,
+                    'sum': { '$sum': { '$sum': '$ratings.rating' } },
+                    'count': { '$sum': { '$size': '$ratings' } }
+                }
+            }
+        ]))
+
+        return result[0]['sum'] / result[0]['count'] if result and result[0]['count'] > 0 else None
+
+    result = list(movies_collection().aggregate([
+        { '$match': movie_filter(movie_id) },
+        { '$project': { '_id': 0, 'average': { '$avg': '$ratings.rating' } } }
+    ]))
+
+    return result[0]['average'] if result else None
+
+
+# Helper expression for get_ratings_by_viewer: the viewer’s rating, picked out of a document’s ratings array.
+def viewer_rating(viewer_id):
+    return {
+        '$arrayElemAt': [
+            { '$filter': { 'input': '$ratings', 'cond': { '$eq': ['$$this.viewer_id', viewer_id] } } },
+            0
+        ]
+    }
+
+
+# The multikey index finds the movies that the viewer rated; `$filter` then picks the viewer’s rating out of each
+# movie’s array, so only the title and that one rating come back instead of the whole array.
+#
+# With buckets, the index finds the viewer’s buckets instead (a viewer rates a movie once, so that’s one bucket per
+# movie), and each movie’s title is looked up from the movies collection through its `id` index.
+def get_ratings_by_viewer(viewer_id, limit=100):
+    viewer_id = int(viewer_id)
+    if uses_buckets():
+        cursor = buckets_collection().aggregate([
+            { '$match': { 'ratings.viewer_id': viewer_id } },
+            { '$project': { 'movie_id': 1, 'rating': viewer_rating(viewer_id) } },
+            { '$lookup': { 'from': MOVIE_COLLECTION, 'localField': 'movie_id', 'foreignField': 'id', 'as': 'movie' } },
+            {
+                '$project': {
+                    '_id': 0,
+                    'date_rated': '$rating.date_rated',
+                    'title': { '$arrayElemAt': ['$movie.title', 0] },
+                    'rating': '$rating.rating'
+                }
+            },
+            { '$sort': { 'date_rated': 1, 'title': 1 } },
+            { '$limit': limit }
+        ])
+
+        return list(cursor)
+
+    cursor = movies_collection().aggregate([
+        { '$match': { 'ratings.viewer_id': viewer_id } },
+        { '$project': { 'title': 1, 'rating': viewer_rating(viewer_id) } },
+        {
+            '$project': {
+                '_id': 0,
+                'date_rated': '$rating.date_rated',
+                'title': 1,
+                'rating': '$rating.rating'
+            }
+        },
+        { '$sort': { 'date_rated': 1, 'title': 1 } },
+        { '$limit': limit }
+    ])
+
+    return list(cursor)
+
+
+# New movies get a MongoDB object ID rather than a Netflix ID. A new movie can show up in title searches, so adding
+# one empties the cached results.
+@invalidates(search_movies_by_title, get_average_rating_of_movie)
+def insert_movie(title, year):
+    movie = {
+        'title': title,
+        'year': year,
+        'ratings': [] # Initialize just for consistency.
+    }
+
+    # `insert_one` adds the new document’s `_id` to the dictionary that it is given.
+    movies_collection().insert_one(movie)
+    return movie
@@ -1,62 +1,80 @@
-import csv
-import json
-import re
-
 """
 This program generates direct JSON literals from the source Netflix Prize ratings files.
 This allows us to pass the data directly into a `mongoimport`.
 
 Upon completion, we will have a collection of movies that _only_ have ratings.
+
+The ratings go straight from the source lines into JSON text, with no dictionary per rating
+in between—100 million small dictionaries cost far more memory and time than the text they
+turn into.
+
+A MongoDB document can’t be larger than 16 megabytes, and the most popular movies, with over
+200,000 ratings, come uncomfortably close. `--bucket-size N` therefore writes each movie’s
+ratings as a series of _bucket_ documents of at most N ratings each, for a separate
+collection: `{"movie_id": ..., "bucket": <0, 1, 2, ...>, "ratings": [...]}`.
+
+Buckets also bound the loader’s memory. Each bucket is written out as soon as its N rating
+lines have been read (see `read_movie_slices` in combined_data.py), so no more than N ratings
+of even the most popular movie are in memory at once. Every chunk’s documents go to a
+temporary file rather than into one big string, and the main process copies the files to the
+output in order, so a worker never holds a whole chunk’s worth of text either.
 """
 
-# For simplicity, we assume that the program runs where the files are located.
-RATING_SOURCES = [
-    'combined_data_1.txt',
-    'combined_data_2.txt',
-    'combined_data_3.txt',
-    'combined_data_4.txt'
-]
-
-# The all-important pattern indicating the current movie.
-MOVIE_LINE_PATTERN = '^(\d+):$'
-MOVIE_LINE = re.compile(MOVIE_LINE_PATTERN)
-
-
-# Helper function for sending movie updates.
-def print_ratings(movie_id, ratings):
-    print(json.dumps({
-        'id': movie_id,
-        'ratings': ratings
-    }))
-
-
-current_movie_id = None
-current_ratings = []
-
-# Read the files line by line and accumulate them into arrays for the current movie ID.
-for ratings_file in RATING_SOURCES:
-    with open(ratings_file, 'r+') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            movie_match = MOVIE_LINE.match(row[0])
-            if movie_match:
-                # We’re done with a movie, so time to emit its document.
-                if current_movie_id is not None:
-                    print_ratings(current_movie_id, current_ratings)
-
-                # Set the new movie ID and start a new list of ratings.
-                current_movie_id = movie_match.group(1)
-                current_ratings = []
-            else:
-                # Add a rating to the current array.
-                viewer_id = int(row[0])
-                rating = int(row[1])
-                date_rated = row[2]
-                current_ratings.append({
-                    'viewer_id': viewer_id,
-                    'rating': rating,
-                    'date_rated': date_rated
-                })
-
-# We need to end the very last movie update statement.
-print_ratings(current_movie_id, current_ratings)
+import argparse
+import functools
+import os
+import shutil
+import sys
+import tempfile
+
+from combined_data import add_workers_argument, map_chunks, read_movie_slices, read_movies
+
+# The collection that bucket documents are meant for.
+BUCKET_COLLECTION_NAME = 'rating_buckets'
+
+
+# Turns rating lines into the JSON text of an array of ratings. This is what json.dumps would
+# produce from a list of {viewer_id, rating, date_rated} dictionaries, minus the dictionaries.
+def ratings_json(rating_lines):
+    ratings = []
+    for line in rating_lines:
+        viewer_id, rating, date_rated = line.split(',')
+        ratings.append(f'{{"viewer_id": {int(viewer_id)}, "rating": {int(rating)}, "date_rated": "{date_rated}"}}')
+
+    return f'[{", ".join(ratings)}]'
+
+
+# Yields the JSON text of the documents for every movie in the given chunk—or, with a bucket
+# size, their bucket documents, each as soon as its ratings have been read. Movie IDs have
+# always been strings in these documents, so we keep them that way.
+def chunk_documents(bucket_size, chunk):
+    if bucket_size > 0:
+        for movie_id, bucket, rating_lines in read_movie_slices(chunk, bucket_size):
+            if rating_lines:
+                yield f'{{"movie_id": "{movie_id}", "bucket": {bucket}, "ratings": {ratings_json(rating_lines)}}}\n'
+    else:
+        for movie_id, rating_lines in read_movies(chunk):
+            yield f'{{"id": "{movie_id}", "ratings": {ratings_json(rating_lines)}}}\n'
+
+
+# Every chunk starts on a movie line, so a chunk always holds complete movies. Their documents
+# are written to a temporary file, whose name goes back to the main process.
+def process_chunk(bucket_size, chunk):
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.json', delete=False) as f:
+        f.writelines(chunk_documents(bucket_size, chunk))
+        return f.name
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prints mongoimport JSON for the combined_data ratings.')
+    parser.add_argument('--bucket-size', type=int, default=0, metavar='N',
+        help=f'write {BUCKET_COLLECTION_NAME} documents of at most N ratings each (default: 0, meaning one document per movie)')
+    add_workers_argument(parser)
+    args = parser.parse_args()
+
+    # Chunks come back in file order, so the documents print in the same order either way.
+    for document_file in map_chunks(functools.partial(process_chunk, args.bucket_size), args.workers):
+        with open(document_file, encoding='utf-8') as f:
+            shutil.copyfileobj(f, sys.stdout)
+
+        os.remove(document_file)
@@ -1,54 +1,45 @@
-import csv
-import re
-import sys
+import argparse
 
-# For simplicity, we assume that the program runs where the files are located.
-SOURCES = [
-    'combined_data_1.txt',
-    'combined_data_2.txt',
-    'combined_data_3.txt',
-    'combined_data_4.txt'
-]
+from movie_index import load_index, read_movie_ratings
 
-# The all-important pattern indicating the current movie.
-MOVIE_LINE_PATTERN = '^(\d+):$'
-MOVIE_LINE = re.compile(MOVIE_LINE_PATTERN)
+parser = argparse.ArgumentParser(description='Computes the average rating of one or more movies.')
+parser.add_argument('movie_ids', metavar='movie_id', nargs='+')
+parser.add_argument('--store', metavar='DIRECTORY',
+    help='read from a columnar ratings store (see preprocess_ratings.py --format columnar) instead of combined_data')
+args = parser.parse_args()
 
-# Check for arguments.
-if len(sys.argv) != 2:
-    print('Usage: average_ratings.py <movie_id>')
-    exit()
+try:
+    query_movie_ids = [int(movie_id) for movie_id in args.movie_ids]
+except ValueError:
+    print(f'Sorry, something went wrong. Please ensure that “{" ".join(args.movie_ids)}” are valid movie IDs.')
+    exit(1)
 
-query_movie_id = sys.argv[1]
-movie_found = False
-rating_total = 0
-rating_count = 0
+if args.store:
+    # With the columnar store, all of the statistics for all of the requested movies are
+    # computed by numpy (see rating_stats.py), which is only imported if we need it.
+    from ratings_store import RatingsStore
+    from rating_stats import movie_statistics
 
-# Read the files line by line until we locate the movie being requested.
-for ratings_file in SOURCES:
-    with open(ratings_file, 'r+') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            movie_match = MOVIE_LINE.match(row[0])
-            if movie_match:
-                # Check if we have found the movie we're looking for.
-                current_movie_id = movie_match.group(1)
-                if current_movie_id == query_movie_id:
-                    movie_found = True
-                else:
-                    # If we have already found the movie and we have changed
-                    # movies, then we are done because ratings are grouped
-                    # together by movie---once we have found the ratings for
-                    # a given movie, we know that we have found them all.
-                    if movie_found:
-                        break
-            elif movie_found:
-                # Include the current rating in our tally.
-                print(f'Tallying {row}...') # Provide some feedback.
-                rating = int(row[1])
-                rating_total = rating_total + rating
-                rating_count = rating_count + 1
+    statistics = movie_statistics(RatingsStore(args.store), query_movie_ids)
+    for movie_id, count, mean, variance, histogram, first_date, last_date in zip(*statistics):
+        if count == 0:
+            print(f'Movie {movie_id} has no known ratings.')
+            continue
 
-rating_average = rating_total / rating_count
-print(f'Movie {query_movie_id} has an average rating of {rating_average}\
+        print(f'Movie {movie_id} has an average rating of {mean}\
+ over {count} known ratings.')
+        print(f'  Variance {variance:.4f}; 1–5 histogram {histogram.tolist()}; rated from {first_date} to {last_date}.')
+else:
+    # As with query_ratings.py, the index lets us go directly to each movie’s ratings.
+    index = load_index()
+    for query_movie_id in query_movie_ids:
+        rows = read_movie_ratings(query_movie_id, index)
+        if not rows:
+            print(f'Movie {query_movie_id} has no known ratings.')
+            continue
+
+        rating_total = sum(int(row[1]) for row in rows)
+        rating_count = len(rows)
+        rating_average = rating_total / rating_count
+        print(f'Movie {query_movie_id} has an average rating of {rating_average}\
  over {rating_count} known ratings.')
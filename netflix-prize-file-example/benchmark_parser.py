@@ -0,0 +1,76 @@
+"""
+This program measures how quickly different approaches can read the combined_data files: the
+original `csv.reader` plus regular expression loop, then the readers in combined_data.py.
+Each approach reads the same bytes and counts the same ratings, so the numbers can be
+compared directly. Try it on a single file first—each approach reads everything it is given!
+
+    python3 benchmark_parser.py combined_data_1.txt
+"""
+
+import argparse
+import csv
+import os
+import re
+import time
+
+from combined_data import SOURCES, rating_columns, read_movies, read_ratings
+
+# The all-important pattern indicating the current movie, as used by the original programs.
+MOVIE_LINE_PATTERN = '^(\d+):$'
+MOVIE_LINE = re.compile(MOVIE_LINE_PATTERN)
+
+
+def csv_and_regex(source):
+    rating_count = 0
+    with open(source, 'r+') as f:
+        reader = csv.reader(f)
+        for row in reader:
+            movie_match = MOVIE_LINE.match(row[0])
+            if movie_match:
+                current_movie_id = movie_match.group(1)
+            else:
+                viewer_id = int(row[0])
+                rating = int(row[1])
+                rating_count = rating_count + 1
+
+    return rating_count
+
+
+def movie_lines(source):
+    return sum(len(rating_lines) for _, rating_lines in read_movies((source, 0, None)))
+
+
+def rating_tuples(source):
+    rating_count = 0
+    for _ in read_ratings((source, 0, None)):
+        rating_count = rating_count + 1
+
+    return rating_count
+
+
+def column_arrays(source):
+    return sum(len(rating_columns(rating_lines)[1]) for _, rating_lines in read_movies((source, 0, None)))
+
+
+APPROACHES = [
+    ('csv.reader + regex', csv_and_regex),
+    ('read_movies (lines)', movie_lines),
+    ('read_ratings (tuples)', rating_tuples),
+    ('rating_columns (arrays)', column_arrays)
+]
+
+parser = argparse.ArgumentParser(description='Measures combined_data parsing throughput.')
+parser.add_argument('sources', metavar='source', nargs='*', default=SOURCES)
+args = parser.parse_args()
+
+for name, approach in APPROACHES:
+    rating_count = 0
+    byte_count = 0
+    start = time.perf_counter()
+    for source in args.sources:
+        rating_count = rating_count + approach(source)
+        byte_count = byte_count + os.path.getsize(source)
+
+    elapsed = time.perf_counter() - start
+    print(f'{name:>24}: {rating_count} ratings in {elapsed:.2f}s —\
+ {byte_count / elapsed / 1024 / 1024:.1f} MB/s, {rating_count / elapsed / 1000000:.2f}M ratings/s')
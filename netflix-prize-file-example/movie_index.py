@@ -0,0 +1,176 @@
+"""
+This module builds and reads a byte-offset index of the movies in the combined_data files.
+
+Without an index, finding the ratings for a movie means reading every line before that
+movie’s `<movie_id>:` header—for the last movies in combined_data_4.txt, that’s around two
+gigabytes of reading. The index records, for every movie header, which file it is in, the
+byte offset where its ratings begin, how many bytes those ratings occupy, and how many
+ratings there are. With that, a program can `seek` straight to a movie’s ratings.
+
+The index is stored in a compact binary “sidecar” file next to the data files. Along with
+the movie entries, it remembers the size and modification time of every source file; if
+any of those change, the index is considered stale and is rebuilt automatically.
+
+Running this module directly (re)builds the index:
+
+    python3 movie_index.py
+"""
+
+import os
+import struct
+import sys
+
+# For simplicity, we assume that the program runs where the files are located.
+SOURCES = [
+    'combined_data_1.txt',
+    'combined_data_2.txt',
+    'combined_data_3.txt',
+    'combined_data_4.txt'
+]
+
+INDEX_FILE = 'combined_data.idx'
+
+# Binary layout of the index file. Everything is little-endian so that the file means
+# the same thing on any machine.
+INDEX_MAGIC = b'NFXIDX01'
+SOURCE_COUNT = struct.Struct('<I')
+SOURCE_ENTRY = struct.Struct('<QqH')  # size, mtime (ns), name length; the name follows.
+MOVIE_COUNT = struct.Struct('<I')
+MOVIE_ENTRY = struct.Struct('<IBQII')  # movie ID, source number, offset, length, rating count
+
+
+def source_signature(source):
+    stats = os.stat(source)
+    return (stats.st_size, stats.st_mtime_ns)
+
+
+def scan_source(source, source_number):
+    """
+    Yields one (movie_id, source_number, offset, length, rating_count) entry per movie header
+    found in the given file. Offsets are in bytes and point at the first rating line _after_
+    the header, so that a reader can seek there and read exactly `length` bytes.
+    """
+    movie_id = None
+    block_start = 0
+    rating_count = 0
+    position = 0
+    with open(source, 'rb') as f:
+        for line in f:
+            if line.rstrip().endswith(b':'):
+                if movie_id is not None:
+                    yield (movie_id, source_number, block_start, position - block_start, rating_count)
+
+                movie_id = int(line.rstrip()[:-1])
+                block_start = position + len(line)
+                rating_count = 0
+            else:
+                rating_count = rating_count + 1
+
+            position = position + len(line)
+
+    # The last movie in the file ends where the file does.
+    if movie_id is not None:
+        yield (movie_id, source_number, block_start, position - block_start, rating_count)
+
+
+def build_index(sources=SOURCES, index_file=INDEX_FILE):
+    entries = []
+    for source_number, source in enumerate(sources):
+        # Provide some visible output so that the user can see where we are. This goes to
+        # standard error so that it doesn’t mix with the output of the querying programs.
+        print(f'Indexing file {source}...', file=sys.stderr)
+        entries.extend(scan_source(source, source_number))
+
+    # We write to a temporary file first then move it into place, so that an interrupted
+    # build never leaves a half-written index behind.
+    temporary_file = f'{index_file}.tmp'
+    with open(temporary_file, 'wb') as f:
+        f.write(INDEX_MAGIC)
+        f.write(SOURCE_COUNT.pack(len(sources)))
+        for source in sources:
+            name = source.encode('utf-8')
+            f.write(SOURCE_ENTRY.pack(*source_signature(source), len(name)))
+            f.write(name)
+
+        f.write(MOVIE_COUNT.pack(len(entries)))
+        for entry in entries:
+            f.write(MOVIE_ENTRY.pack(*entry))
+
+    os.replace(temporary_file, index_file)
+    return {entry[0]: (sources[entry[1]], *entry[2:]) for entry in entries}
+
+
+def read_index(sources=SOURCES, index_file=INDEX_FILE):
+    """
+    Returns the index as a dictionary of movie ID to (source, offset, length, rating_count),
+    or None if the index file is missing or no longer matches the source files.
+    """
+    try:
+        with open(index_file, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    if not data.startswith(INDEX_MAGIC):
+        return None
+
+    position = len(INDEX_MAGIC)
+    (source_count,) = SOURCE_COUNT.unpack_from(data, position)
+    position = position + SOURCE_COUNT.size
+    if source_count != len(sources):
+        return None
+
+    for source in sources:
+        size, mtime, name_length = SOURCE_ENTRY.unpack_from(data, position)
+        position = position + SOURCE_ENTRY.size
+        name = data[position:position + name_length].decode('utf-8')
+        position = position + name_length
+        if name != source or (size, mtime) != source_signature(source):
+            return None
+
+    (movie_count,) = MOVIE_COUNT.unpack_from(data, position)
+    position = position + MOVIE_COUNT.size
+
+    index = {}
+    for movie_id, source_number, offset, length, rating_count in \
+            MOVIE_ENTRY.iter_unpack(data[position:position + movie_count * MOVIE_ENTRY.size]):
+        index[movie_id] = (sources[source_number], offset, length, rating_count)
+
+    return index
+
+
+def load_index(sources=SOURCES, index_file=INDEX_FILE):
+    """
+    Returns the current index, building it first if it is missing or stale.
+    """
+    index = read_index(sources, index_file)
+    if index is None:
+        index = build_index(sources, index_file)
+
+    return index
+
+
+def read_movie_ratings(movie_id, index=None):
+    """
+    Returns the rating rows for the given movie as lists of [viewer_id, rating, date] strings
+    (the same shape that `csv.reader` produces for those lines), or None if there is no such
+    movie in the files.
+    """
+    if index is None:
+        index = load_index()
+
+    entry = index.get(movie_id)
+    if entry is None:
+        return None
+
+    source, offset, length, _ = entry
+    with open(source, 'rb') as f:
+        f.seek(offset)
+        block = f.read(length)
+
+    return [line.split(',') for line in block.decode('utf-8').splitlines() if line]
+
+
+if __name__ == '__main__':
+    index = build_index()
+    print(f'Indexed {len(index)} movies into {INDEX_FILE}.')
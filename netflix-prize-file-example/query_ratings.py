@@ -1,46 +1,36 @@
-import csv
-import re
-import sys
+import argparse
 
-# For simplicity, we assume that the program runs where the files are located.
-SOURCES = [
-    'combined_data_1.txt',
-    'combined_data_2.txt',
-    'combined_data_3.txt',
-    'combined_data_4.txt'
-]
+from movie_index import load_index, read_movie_ratings
+from ratings_store import RatingsStore, date_string
 
-# The all-important pattern indicating the current movie.
-MOVIE_LINE_PATTERN = '^(\d+):$'
-MOVIE_LINE = re.compile(MOVIE_LINE_PATTERN)
+parser = argparse.ArgumentParser(description='Prints all of the ratings of a particular movie.')
+parser.add_argument('movie_id')
+parser.add_argument('--store', metavar='DIRECTORY',
+    help='read from a columnar ratings store (see preprocess_ratings.py --format columnar) instead of combined_data')
+args = parser.parse_args()
 
-# Check for arguments.
-if len(sys.argv) != 2:
-    print('Usage: query_ratings.py <movie_id>')
-    exit()
+query_movie_id = args.movie_id
+try:
+    if args.store:
+        # The columnar store already knows which rows belong to the movie and needs no
+        # parsing, so we just convert the numbers back into the original text format.
+        columns = RatingsStore(args.store).ratings_of_movie(int(query_movie_id))
+        ratings = None if columns is None else [
+            [str(viewer_id), str(rating), date_string(date)] for viewer_id, rating, date in zip(*columns)
+        ]
+    else:
+        # The index tells us exactly where the movie’s ratings are, so instead of reading the
+        # files line by line until we locate the movie, we jump straight to its ratings. The
+        # index is built (or rebuilt) here if needed, so the very first query takes a while.
+        ratings = read_movie_ratings(int(query_movie_id), load_index())
+except ValueError:
+    print(f'Sorry, something went wrong. Please ensure that “{query_movie_id}” is a valid movie ID.')
+    exit(1)
 
-query_movie_id = sys.argv[1]
-movie_found = False
+if ratings is None:
+    exit()
 
-# Read the files line by line until we locate the movie being requested.
-for ratings_file in SOURCES:
-    with open(ratings_file, 'r+') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            movie_match = MOVIE_LINE.match(row[0])
-            if movie_match:
-                # Check if we have found the movie we're looking for.
-                current_movie_id = movie_match.group(1)
-                if current_movie_id == query_movie_id:
-                    movie_found = True
-                else:
-                    # If we have already found the movie and we have changed
-                    # movies, then we are done because ratings are grouped
-                    # together by movie---once we have found the ratings for
-                    # a given movie, we know that we have found them all.
-                    if movie_found:
-                        exit()
-            elif movie_found:
-                # We can get fancier about how we print the result but that
-                # isn't necessary for our purposes.
-                print(row)
+for row in ratings:
+    # We can get fancier about how we print the result but that
+    # isn't necessary for our purposes.
+    print(row)
@@ -0,0 +1,105 @@
+"""
+This module computes per-movie rating statistics over a columnar ratings store (see
+ratings_store.py) using numpy, so that whole columns are processed at once rather than one
+rating at a time in a Python loop.
+
+For every requested movie, we compute the number of ratings, their mean and (population)
+variance, a histogram of how many 1s, 2s, 3s, 4s, and 5s were given, and the dates of the
+first and last ratings. This can be done for one movie, a list of movies, or—in a single
+pass over the store—every movie at once.
+
+The trick that makes the whole-catalog pass cheap is that ratings can only be 1 to 5: once
+we have the per-movie histogram, the count, sum, and sum of squares all follow from it, so
+the only full pass needed over the ratings is a `bincount`.
+"""
+
+from collections import namedtuple
+
+import numpy
+
+# Each field is a numpy array with one entry per movie, in the same order as `movie_id`.
+# `histogram` has five columns, for ratings 1 through 5. Dates are `datetime64[D]`.
+MovieStatistics = namedtuple('MovieStatistics',
+    ['movie_id', 'count', 'mean', 'variance', 'histogram', 'first_date', 'last_date'])
+
+RATING_VALUES = numpy.arange(1, 6)
+
+# The whole-catalog pass converts this many rows at a time, to keep temporary arrays small.
+CHUNK_ROWS = 1 << 24
+
+
+def statistics_from_histograms(movie_ids, histograms, first_dates, last_dates):
+    counts = histograms.sum(axis=1)
+    sums = histograms @ RATING_VALUES
+    sums_of_squares = histograms @ (RATING_VALUES * RATING_VALUES)
+
+    # Movies without ratings get NaN for their mean and variance, instead of a division warning.
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+        variances = sums_of_squares / counts - means * means
+
+    return MovieStatistics(
+        movie_id=movie_ids,
+        count=counts,
+        mean=means,
+        variance=variances,
+        histogram=histograms,
+        first_date=first_dates.astype('datetime64[D]'),
+        last_date=last_dates.astype('datetime64[D]')
+    )
+
+
+def all_movie_statistics(store):
+    """
+    Computes statistics for every movie that has at least one rating, in one pass over the store.
+    """
+    movie_count = store.max_movie_id + 1
+
+    # Movie ID and rating are combined into a single bucket number so that one `bincount`
+    # produces every movie’s histogram at once.
+    buckets = numpy.zeros(movie_count * 6, dtype=numpy.int64)
+    for start in range(0, len(store), CHUNK_ROWS):
+        end = start + CHUNK_ROWS
+        bucket_numbers = store.movie_id[start:end].astype(numpy.uint32) * 6 + store.rating[start:end]
+        buckets += numpy.bincount(bucket_numbers, minlength=movie_count * 6)
+
+    histograms = buckets.reshape(movie_count, 6)[:, 1:]
+
+    # Because each movie’s ratings are contiguous, `reduceat` at each movie’s starting row
+    # finds first and last dates for all movies in one call. It misbehaves with empty
+    # ranges, so it is only given the movies that actually have ratings.
+    movie_ids = numpy.flatnonzero(histograms.sum(axis=1))
+    starts = numpy.asarray(store.offsets[movie_ids], dtype=numpy.int64)
+    first_dates = numpy.minimum.reduceat(store.date, starts) if len(starts) else numpy.empty(0, dtype=numpy.int64)
+    last_dates = numpy.maximum.reduceat(store.date, starts) if len(starts) else numpy.empty(0, dtype=numpy.int64)
+
+    return statistics_from_histograms(movie_ids, histograms[movie_ids], first_dates, last_dates)
+
+
+def movie_statistics(store, movie_ids=None):
+    """
+    Computes statistics for the given movie IDs (a single ID or any iterable of them), or for
+    all movies if none are given. Movies with no ratings are included with a count of 0.
+    """
+    if movie_ids is None:
+        return all_movie_statistics(store)
+
+    movie_ids = numpy.atleast_1d(numpy.asarray(movie_ids, dtype=numpy.int64))
+    histograms = numpy.zeros((len(movie_ids), 5), dtype=numpy.int64)
+
+    # NaT is how numpy spells a missing date.
+    not_a_time = numpy.datetime64('NaT', 'D').astype(numpy.int64)
+    first_dates = numpy.full(len(movie_ids), not_a_time)
+    last_dates = numpy.full(len(movie_ids), not_a_time)
+
+    for i, movie_id in enumerate(movie_ids):
+        columns = store.ratings_of_movie(int(movie_id))
+        if columns is None or len(columns[1]) == 0:
+            continue
+
+        _, ratings, dates = columns
+        histograms[i] = numpy.bincount(ratings, minlength=6)[1:6]
+        first_dates[i] = dates.min()
+        last_dates[i] = dates.max()
+
+    return statistics_from_histograms(movie_ids, histograms, first_dates, last_dates)
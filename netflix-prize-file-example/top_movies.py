@@ -0,0 +1,39 @@
+"""
+This program answers the question that average_ratings.py left “as an exercise”: which movies
+have the highest average ratings? It computes statistics for every movie at once from the
+columnar ratings store (see preprocess_ratings.py --format columnar), then ranks them.
+"""
+
+import argparse
+import csv
+import os
+
+import numpy
+
+from ratings_store import DEFAULT_STORE, RatingsStore
+from rating_stats import movie_statistics
+
+MOVIE_SOURCE = 'movie_titles.csv'
+
+parser = argparse.ArgumentParser(description='Lists the movies with the highest average ratings.')
+parser.add_argument('--store', metavar='DIRECTORY', default=DEFAULT_STORE)
+parser.add_argument('--limit', type=int, default=20, help='how many movies to list (default: 20)')
+parser.add_argument('--min-ratings', type=int, default=1000,
+    help='leave out movies with fewer ratings than this, since a handful of 5s is not much of a consensus (default: 1000)')
+args = parser.parse_args()
+
+statistics = movie_statistics(RatingsStore(args.store))
+
+# Sort by average (descending), breaking ties with the number of ratings.
+eligible = numpy.flatnonzero(statistics.count >= args.min_ratings)
+ranking = eligible[numpy.lexsort((-statistics.count[eligible], -statistics.mean[eligible]))][:args.limit]
+
+# Titles are a nice touch but not essential, so we only show them if the file is around.
+titles = {}
+if os.path.exists(MOVIE_SOURCE):
+    with open(MOVIE_SOURCE, 'r+', encoding='iso-8859-1') as f:
+        titles = {int(row[0]): ', '.join(row[2:]) for row in csv.reader(f)}
+
+for place, i in enumerate(ranking, start=1):
+    movie_id = int(statistics.movie_id[i])
+    print(f'{place}. {movie_id} “{titles.get(movie_id, "?")}”: {statistics.mean[i]:.4f} over {statistics.count[i]} ratings')
@@ -0,0 +1,166 @@
+"""
+This program prepares every file that `neo4j-admin import` needs in a single pass over the
+source data, instead of running preprocess_movies.py, preprocess_viewers.py, and
+preprocess_ratings.py one after another—two of which each read all of combined_data.
+
+As each chunk of combined_data is read (see combined_data.py), it is turned into both its
+ratings CSV lines and the viewer IDs that haven’t been seen before, so the 2 gigabytes of
+ratings are read once rather than twice. The movies come from movie_titles.csv as usual.
+
+Everything goes into one destination folder (`import` by default), along with copies of the
+header files that go with each kind of file:
+
+- `--gzip` compresses the output, which `neo4j-admin import` reads as is. The compressing
+  happens in the worker processes, chunk by chunk. Each chunk becomes its own gzip “member,”
+  and a gzip file is allowed to be a series of members, so the chunks can simply be appended.
+- `--shards N` spreads the viewers and ratings across N files apiece (by chunk), which
+  `neo4j-admin import` can read in parallel.
+
+When it’s done, the program prints the `neo4j-admin import` command that loads the output.
+"""
+
+import argparse
+import csv
+import functools
+import gzip
+import os
+import shutil
+
+from combined_data import add_workers_argument, map_chunks, read_movies
+from preprocess_movies import movie_rows
+from preprocess_viewers import ViewerSet
+
+DEFAULT_DESTINATION = 'import'
+
+# The header file for each kind of output, and how many columns it describes—which must match
+# what this program writes.
+HEADERS = {
+    'movies': ('movie_header.csv', 3),
+    'viewers': ('viewer_header.csv', 1),
+    'ratings': ('rating_header.csv', 4)
+}
+
+# gzip’s default level (9) squeezes out a few more bytes at several times the cost; level 6
+# is the usual compromise.
+GZIP_LEVEL = 6
+
+
+def file_name(kind, shard, shards, compress):
+    suffix = '.csv.gz' if compress else '.csv'
+    return f'{kind}{suffix}' if shards == 1 else f'{kind}-{shard + 1}{suffix}'
+
+
+def encode(text, compress):
+    data = text.encode('utf-8')
+    return gzip.compress(data, compresslevel=GZIP_LEVEL) if compress else data
+
+
+def copy_headers(destination):
+    for kind, (header, column_count) in HEADERS.items():
+        with open(header) as f:
+            columns = next(csv.reader(f))
+
+        if len(columns) != column_count:
+            raise SystemExit(f'{header} describes {len(columns)} columns, but {kind} have {column_count}.')
+
+        shutil.copy(header, destination)
+
+
+def write_movies(destination, compress):
+    path = os.path.join(destination, file_name('movies', 0, 1, compress))
+    with (gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=GZIP_LEVEL) if compress
+            else open(path, 'w', encoding='utf-8', newline='')) as f:
+        writer = csv.writer(f)
+        for row in movie_rows():
+            writer.writerow(row)
+
+
+# Each chunk becomes its ratings CSV data (ready to write, compressed if requested), plus the
+# viewer IDs that it contains in order of first appearance and without repeats _within_ the
+# chunk. The movie IDs come along for some output guidance.
+def process_chunk(compress, chunk):
+    movie_ids = []
+    text = []
+    seen = ViewerSet()
+    viewer_ids = []
+    for movie_id, rating_lines in read_movies(chunk):
+        movie_ids.append(movie_id)
+        if rating_lines:
+            prefix = f'{movie_id},'
+            text.append(prefix)
+            text.append(f'\n{prefix}'.join(rating_lines))
+            text.append('\n')
+
+        # The viewer ID is everything before the first comma; no need to split the rest.
+        for line in rating_lines:
+            viewer_id = int(line[:line.index(',')])
+            if seen.add(viewer_id):
+                viewer_ids.append(viewer_id)
+
+    return (movie_ids, viewer_ids, encode(''.join(text), compress))
+
+
+def import_command(destination, shards, compress):
+    # The movies are always a single file; the others are spread across the shards.
+    def files(kind):
+        count = 1 if kind == 'movies' else shards
+        names = [HEADERS[kind][0]] + [file_name(kind, shard, count, compress) for shard in range(count)]
+        return ','.join(os.path.join(destination, name) for name in names)
+
+    return ' '.join([
+        'neo4j-admin import',
+        f'--nodes=Movie="{files("movies")}"',
+        f'--nodes=Viewer="{files("viewers")}"',
+        f'--relationships=RATED="{files("ratings")}"',
+        '--id-type=STRING'
+    ])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes the movie, viewer, and rating files for neo4j-admin import in one pass.')
+    parser.add_argument('--destination', default=DEFAULT_DESTINATION,
+        help=f'folder to write the files into (default: {DEFAULT_DESTINATION})')
+    parser.add_argument('--gzip', action='store_true', help='compress the files with gzip')
+    parser.add_argument('--shards', type=int, default=1, metavar='N',
+        help='number of files to spread the viewers and ratings across (default: 1)')
+    add_workers_argument(parser)
+    args = parser.parse_args()
+
+    if args.shards < 1:
+        parser.error('--shards must be at least 1')
+
+    os.makedirs(args.destination, exist_ok=True)
+    copy_headers(args.destination)
+    write_movies(args.destination, args.gzip)
+
+    def open_shards(kind):
+        return [
+            open(os.path.join(args.destination, file_name(kind, shard, args.shards, args.gzip)), 'wb')
+            for shard in range(args.shards)
+        ]
+
+    viewer_files = open_shards('viewers')
+    rating_files = open_shards('ratings')
+
+    # Chunks may overlap in the viewers they contain, so this is where duplicates across chunks
+    # get filtered out. Each chunk’s new viewers and its ratings go to the same shard, taking
+    # turns.
+    seen = ViewerSet()
+    process = functools.partial(process_chunk, args.gzip)
+    for index, (movie_ids, viewer_ids, ratings) in enumerate(map_chunks(process, args.workers)):
+        # Provide some visible output.
+        for movie_id in movie_ids:
+            print(f'- Movie ID: {movie_id}')
+
+        shard = index % args.shards
+        new_viewers = ''.join(f'{viewer_id}\n' for viewer_id in viewer_ids if seen.add(viewer_id))
+        if new_viewers:
+            viewer_files[shard].write(encode(new_viewers, args.gzip))
+
+        rating_files[shard].write(ratings)
+
+    for f in viewer_files + rating_files:
+        f.close()
+
+    print('Done. To load these files into a new database, run:')
+    print(f'    NEO4J_CONF=<absolute path to conf directory> {import_command(args.destination, args.shards, args.gzip)}')
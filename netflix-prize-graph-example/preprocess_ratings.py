@@ -1,40 +1,70 @@
-import csv
-import re
+import argparse
+import functools
+from array import array
 
-# For simplicity, we assume that the program runs where the files are located.
-SOURCES = [
-    'combined_data_1.txt',
-    'combined_data_2.txt',
-    'combined_data_3.txt',
-    'combined_data_4.txt'
-]
+from combined_data import add_workers_argument, map_chunks, rating_columns, read_movies
+from ratings_store import DEFAULT_STORE, RatingsStoreWriter, day_number
 
 DESTINATION = 'ratings.csv'
 
-# The all-important pattern indicating the current movie.
-MOVIE_LINE_PATTERN = '^(\d+):$'
-MOVIE_LINE = re.compile(MOVIE_LINE_PATTERN)
-
-post_processed_file = open(DESTINATION, 'w')
-current_movie_id = None
-
-# Read the files line by line and write them out with the movie ID prepended.
-for ratings_file in SOURCES:
-    # Provide some visible output so that the user can see where we are.
-    print(f'Processing file {ratings_file}...')
-
-    with open(ratings_file, 'r+') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            movie_match = MOVIE_LINE.match(row[0])
-            if movie_match:
-                # Set the new movie ID.
-                current_movie_id = movie_match.group(1)
-
-                # Provide more visible output.
-                print(f'- Movie ID: {current_movie_id}')
-            else:
-                rating_line = ','.join([current_movie_id, *row])
-                post_processed_file.write(f'{rating_line}\n')
-
-post_processed_file.close()
+
+# Each chunk of the combined_data files is converted on its own—possibly in another process—
+# into a list of the movie IDs that it contains plus whatever the chosen format needs written.
+def process_chunk(format, chunk):
+    movie_ids = []
+    if format == 'columnar':
+        # For the columnar store, each movie’s ratings become compact arrays.
+        movies = []
+        for movie_id, rating_lines in read_movies(chunk):
+            movie_ids.append(movie_id)
+            viewer_ids, ratings, dates = rating_columns(rating_lines)
+            movies.append((movie_id, viewer_ids, ratings, array('H', map(day_number, dates))))
+
+        return (movie_ids, movies)
+
+    # For CSV, the chunk becomes the text to write, with the movie ID prepended to every line.
+    # The rating lines are already in the right format, so they don’t even need to be split.
+    text = []
+    for movie_id, rating_lines in read_movies(chunk):
+        movie_ids.append(movie_id)
+        if rating_lines:
+            prefix = f'{movie_id},'
+            text.append(prefix)
+            text.append(f'\n{prefix}'.join(rating_lines))
+            text.append('\n')
+
+    return (movie_ids, ''.join(text))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes the combined_data ratings out with the movie ID on every rating.')
+    parser.add_argument('--format', choices=['csv', 'columnar'], default='csv',
+        help=f'csv writes {DESTINATION}; columnar writes a binary column store (see ratings_store.py)')
+    parser.add_argument('--destination',
+        help=f'output file or directory (default: {DESTINATION} or {DEFAULT_STORE}/)')
+    add_workers_argument(parser)
+    args = parser.parse_args()
+
+    if args.format == 'columnar':
+        writer = RatingsStoreWriter(args.destination or DEFAULT_STORE)
+    else:
+        post_processed_file = open(args.destination or DESTINATION, 'w')
+
+    # Read the files chunk by chunk and write them out with the movie ID prepended. Results
+    # come back in file order no matter how many workers there are.
+    for movie_ids, output in map_chunks(functools.partial(process_chunk, args.format), args.workers):
+        # Provide some visible output so that the user can see where we are.
+        for movie_id in movie_ids:
+            print(f'- Movie ID: {movie_id}')
+
+        if args.format == 'columnar':
+            for movie_id, viewer_ids, ratings, days in output:
+                writer.start_movie(movie_id)
+                writer.add_ratings(viewer_ids, ratings, days)
+        else:
+            post_processed_file.write(output)
+
+    if args.format == 'columnar':
+        writer.close()
+    else:
+        post_processed_file.close()
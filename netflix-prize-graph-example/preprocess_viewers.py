@@ -1,49 +1,166 @@
-import csv
-import re
-
-# For simplicity, we assume that the program runs where the files are located.
-SOURCES = [
-    'combined_data_1.txt',
-    'combined_data_2.txt',
-    'combined_data_3.txt',
-    'combined_data_4.txt'
-]
-
-# The all-important pattern indicating the current movie---here we are using it
-# just to provide some output guidance.
-MOVIE_LINE_PATTERN = '^(\d+):$'
-MOVIE_LINE = re.compile(MOVIE_LINE_PATTERN)
-current_movie_id = None
+import argparse
+from array import array
+
+from combined_data import add_workers_argument, map_chunks, rating_columns, read_movies
+from ratings_store import date_string, day_number
 
 DESTINATION = 'viewers.csv'
-post_processed_file = open(DESTINATION, 'w')
-
-# Read the files line by line and write out just the viewer IDs.
-#
-# We compile a list of IDs already seen and filter for uniques here---a choice
-# that assumes that we have enough memory to hold all possible IDs. A pre-count
-# was done to verify that the number of IDs would indeed fit in memory, so we
-# can proceed with this. In the general case, we might not have that luxury.
-viewer_ids = {}
-for ratings_file in SOURCES:
-    # Provide some visible output so that the user can see where we are.
-    print(f'Processing file {ratings_file}...')
-
-    with open(ratings_file, 'r+') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            movie_match = MOVIE_LINE.match(row[0])
-            if movie_match:
-                # Set the new movie ID.
-                current_movie_id = movie_match.group(1)
-
-                # Provide some visible output.
-                print(f'- Movie ID: {current_movie_id}')
+
+# Viewer IDs in the dataset are integers below this number. It is only a starting size: the
+# structures below grow if a larger ID ever shows up.
+VIEWER_ID_LIMIT = 2649430
+
+
+class ViewerSet:
+    """
+    A set of viewer IDs stored as a bit array: viewer ID `n` is in the set if bit `n` is on.
+    Checking and adding are a couple of arithmetic operations each, and covering every
+    possible Netflix Prize viewer ID takes around 330 kilobytes—far less than a dictionary
+    holding 480,000 string keys.
+    """
+    def __init__(self, limit=VIEWER_ID_LIMIT):
+        self.bits = bytearray(limit // 8 + 1)
+
+    def add(self, viewer_id):
+        """
+        Adds the viewer ID to the set, returning True if it wasn’t there before.
+        """
+        byte, bit = viewer_id >> 3, 1 << (viewer_id & 7)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte - len(self.bits) + 1))
+
+        if self.bits[byte] & bit:
+            return False
+
+        self.bits[byte] = self.bits[byte] | bit
+        return True
+
+
+class ViewerStatistics:
+    """
+    Per-viewer rating counts and first/last rating dates, kept in arrays indexed by viewer ID
+    (dates as day numbers; see ratings_store.py). A viewer with a count of 0 never rated.
+    """
+    NO_DATE = 0xFFFF
+
+    def __init__(self, limit=VIEWER_ID_LIMIT):
+        self.counts = array('I', bytes(4 * limit))
+        self.first_days = array('H', [self.NO_DATE]) * limit
+        self.last_days = array('H', bytes(2 * limit))
+
+    def grow(self, limit):
+        extra = limit - len(self.counts)
+        if extra > 0:
+            self.counts.extend(array('I', bytes(4 * extra)))
+            self.first_days.extend(array('H', [self.NO_DATE]) * extra)
+            self.last_days.extend(array('H', bytes(2 * extra)))
+
+    def add(self, viewer_ids, counts, first_days, last_days):
+        """
+        Merges in statistics for the given viewers, as computed from some portion of the ratings.
+        """
+        if len(viewer_ids):
+            self.grow(max(viewer_ids) + 1)
+
+        for viewer_id, count, first_day, last_day in zip(viewer_ids, counts, first_days, last_days):
+            self.counts[viewer_id] = self.counts[viewer_id] + count
+            if first_day < self.first_days[viewer_id]:
+                self.first_days[viewer_id] = first_day
+
+            if last_day > self.last_days[viewer_id]:
+                self.last_days[viewer_id] = last_day
+
+
+# Each chunk reports the movie IDs it saw (just for some output guidance) and the viewer IDs
+# it saw, in order of first appearance and without repeats _within_ the chunk.
+def process_chunk(chunk):
+    movie_ids = []
+    seen = ViewerSet()
+    viewer_ids = array('I')
+    for movie_id, rating_lines in read_movies(chunk):
+        movie_ids.append(movie_id)
+
+        # The viewer ID is everything before the first comma; no need to split the rest.
+        for line in rating_lines:
+            viewer_id = int(line[:line.index(',')])
+            if seen.add(viewer_id):
+                viewer_ids.append(viewer_id)
+
+    return (movie_ids, viewer_ids)
+
+
+# With --stats, each chunk instead reports every viewer it saw along with how many ratings
+# they gave in the chunk and when their first and last ones were.
+def process_chunk_with_statistics(chunk):
+    movie_ids = []
+    viewers = {}
+    for movie_id, rating_lines in read_movies(chunk):
+        movie_ids.append(movie_id)
+        viewer_ids, _, dates = rating_columns(rating_lines)
+        for viewer_id, day in zip(viewer_ids, map(day_number, dates)):
+            viewer = viewers.get(viewer_id)
+            if viewer is None:
+                viewers[viewer_id] = [1, day, day]
             else:
+                viewer[0] = viewer[0] + 1
+                if day < viewer[1]:
+                    viewer[1] = day
+
+                if day > viewer[2]:
+                    viewer[2] = day
+
+    return (movie_ids, (
+        array('I', viewers.keys()),
+        array('I', (viewer[0] for viewer in viewers.values())),
+        array('H', (viewer[1] for viewer in viewers.values())),
+        array('H', (viewer[2] for viewer in viewers.values()))
+    ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=f'Writes the unique viewer IDs in combined_data to {DESTINATION}.')
+    parser.add_argument('--stats', action='store_true',
+        help='also write each viewer’s rating count and first/last rating dates (use viewer_stats_header.csv)')
+    add_workers_argument(parser)
+    args = parser.parse_args()
+
+    post_processed_file = open(DESTINATION, 'w')
+
+    if args.stats:
+        # Statistics can only be written once every rating has been seen, so viewers come out
+        # in viewer ID order rather than in order of first appearance.
+        statistics = ViewerStatistics()
+        for movie_ids, chunk_statistics in map_chunks(process_chunk_with_statistics, args.workers):
+            # Provide some visible output.
+            for movie_id in movie_ids:
+                print(f'- Movie ID: {movie_id}')
+
+            statistics.add(*chunk_statistics)
+
+        for viewer_id, count in enumerate(statistics.counts):
+            if count > 0:
+                first_rated = date_string(statistics.first_days[viewer_id])
+                last_rated = date_string(statistics.last_days[viewer_id])
+                post_processed_file.write(f'{viewer_id},{count},{first_rated},{last_rated}\n')
+    else:
+        # Read the files chunk by chunk and write out just the viewer IDs.
+        #
+        # Viewer IDs are integers with a known upper bound, so the IDs already seen fit in a
+        # bit array (see `ViewerSet`) of a few hundred kilobytes, no matter how many ratings
+        # there are.
+        #
+        # Chunks may overlap in the viewers they contain, so this is where duplicates across
+        # chunks get filtered out. Because results arrive in file order, the output is the
+        # same no matter how many workers there are.
+        seen = ViewerSet()
+        for movie_ids, chunk_viewer_ids in map_chunks(process_chunk, args.workers):
+            # Provide some visible output.
+            for movie_id in movie_ids:
+                print(f'- Movie ID: {movie_id}')
+
+            for viewer_id in chunk_viewer_ids:
                 # Write out the viewer ID if we haven’t seen it before.
-                viewer_id = row[0]
-                if viewer_ids.get(viewer_id) is None:
-                    viewer_ids[viewer_id] = True
+                if seen.add(viewer_id):
                     post_processed_file.write(f'{viewer_id}\n')
 
-post_processed_file.close()
+    post_processed_file.close()
@@ -0,0 +1,19 @@
+import csv
+import sys
+
+from netflix_dal import insert_movies
+
+if len(sys.argv) != 2:
+    print('Usage: add_movies <CSV file of year,title lines>')
+    exit(1)
+
+source = sys.argv[1]
+try:
+    with open(source, newline='') as f:
+        movies = [(', '.join(row[1:]), int(row[0])) for row in csv.reader(f) if row]
+
+    # All of the movies are added in a single transaction.
+    for movie in insert_movies(movies):
+        print(f"Movie “{movie.get('title')}” ({movie.get('year')}) added with ID {movie.id}.")
+except (OSError, ValueError, IndexError):
+    print(f'Sorry, something went wrong. Please ensure that “{source}” is a readable file with a valid year on every line.')
@@ -0,0 +1,260 @@
+"""
+This module adds an in-process result cache to a DAL: decorate a DAL function with `@cached`
+and repeated calls with the same arguments are answered from memory instead of the database.
+
+Entries leave the cache in two ways:
+
+- LRU (least recently used): each cache holds at most `max_size` results; when it is full,
+  the result that was used longest ago makes room for the new one
+- TTL (time to live): a result older than `ttl` seconds is treated as missing, so changes
+  made to the database by _other_ programs (such as a loader) show up within that time
+
+Changes made through the DAL itself don’t have to wait for the TTL: a function that changes
+data declares which cached functions it affects with `@invalidates`, and their caches are
+emptied whenever it succeeds. Emptying a cache also starts a new _generation_ of it: a lookup
+that was already running when the cache was emptied may have read the data from before the
+change, so its result isn’t stored.
+
+Both decorators also work on `async def` functions (like those of the asyncio DALs). There, a
+miss that is already being looked up isn’t looked up again: callers asking for the same
+result at the same time all wait for the one lookup that is in progress.
+
+Every cache counts its hits, misses, and evictions; `cache_statistics()` reports them all.
+
+The defaults come from these optional environment variables:
+
+- DAL_CACHE_SIZE: results kept per cached function (default 1024; 0 turns caching off)
+- DAL_CACHE_TTL: seconds that a result stays valid (default 60)
+
+Arguments become part of a cache key, so they must be hashable. Lists (such as a paging
+cursor decoded from JSON) are the exception: they are converted to tuples first.
+
+Cached results are shared by every caller, so callers should treat them as read-only.
+
+Identical copies of this module live beside each DAL that uses it, so that every example
+stays self-contained.
+"""
+
+import asyncio
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_SIZE = int(os.environ['DAL_CACHE_SIZE']) if os.environ.get('DAL_CACHE_SIZE') else 1024
+DEFAULT_TTL = float(os.environ['DAL_CACHE_TTL']) if os.environ.get('DAL_CACHE_TTL') else 60
+
+# Every cache created by `@cached`, by module and function name.
+caches = {}
+
+
+class ResultCache:
+    """
+    A thread-safe mapping from keys to results with LRU and TTL eviction. Any object with the
+    same `get`, `put`, and `clear` methods can be passed to `@cached` instead—for example, one
+    backed by a cache server that several processes share. Such an object can also have a
+    `generation` like this one’s, to keep lookups that were overtaken by `clear` out of it.
+    """
+    MISSING = object()
+
+    def __init__(self, max_size=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expiration time, result), least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0  # Advanced by every `clear`
+
+    def get(self, key):
+        """
+        Returns the result stored under `key`, or `ResultCache.MISSING` if there is none.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                self.evictions = self.evictions + 1
+                entry = None
+
+            if entry is None:
+                self.misses = self.misses + 1
+                return self.MISSING
+
+            self.entries.move_to_end(key)
+            self.hits = self.hits + 1
+            return entry[1]
+
+    def put(self, key, result, generation=None):
+        """
+        Stores `result` under `key`—unless `generation` is given and the cache has been cleared
+        since then, in which case the result may be out of date and is dropped.
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self.entries[key] = (time.monotonic() + self.ttl, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions = self.evictions + 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation = self.generation + 1
+
+    def statistics(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+def cached(function=None, max_size=None, ttl=None, cache=None):
+    """
+    Decorates a DAL function so that its results are cached by argument. Usable bare
+    (`@cached`) or with options (`@cached(max_size=100, ttl=5)`, or `@cached(cache=...)` to
+    supply a different cache object). The decorated function’s cache is available as its
+    `cache` attribute.
+    """
+    if function is None:
+        return functools.partial(cached, max_size=max_size, ttl=ttl, cache=cache)
+
+    if cache is None:
+        cache = ResultCache(
+            DEFAULT_SIZE if max_size is None else max_size,
+            DEFAULT_TTL if ttl is None else ttl)
+
+    # A cache can be shared with another function (see the asyncio DALs); it is reported under the first one’s name.
+    if all(existing is not cache for existing in caches.values()):
+        caches[f'{function.__module__}.{function.__name__}'] = cache
+
+    enabled = getattr(cache, 'max_size', 1) > 0
+
+    if inspect.iscoroutinefunction(function):
+        return cached_coroutine_function(function, cache, enabled)
+
+    @functools.wraps(function)
+    def cached_function(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+
+        key = cache_key(function, args, kwargs)
+        result = cache.get(key)
+        if result is ResultCache.MISSING:
+            # If another thread empties the cache while `function` runs, the result is left out.
+            generation = getattr(cache, 'generation', None)
+            result = function(*args, **kwargs)
+            store(cache, key, result, generation)
+
+        return result
+
+    cached_function.cache = cache
+    return cached_function
+
+
+# Stores a result in a cache, checking its generation if the cache has one.
+def store(cache, key, result, generation):
+    if generation is None:
+        cache.put(key, result)
+    else:
+        cache.put(key, result, generation)
+
+
+# Lists become tuples, all the way down, so that they can be part of a key.
+def hashable(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable(item) for item in value)
+
+    return value
+
+
+def cache_key(function, args, kwargs):
+    key = (hashable(args), tuple(sorted((name, hashable(value)) for name, value in kwargs.items())))
+    try:
+        hash(key)
+    except TypeError as error:
+        raise TypeError(f'{function.__name__} is cached, so its arguments must be hashable ({error})') from None
+
+    return key
+
+
+def cached_coroutine_function(function, cache, enabled):
+    # Lookups in progress, by cache generation and key. Each one is a task that every caller with the same key awaits.
+    # Once the cache is emptied, new callers start a lookup of their own rather than joining one that began before
+    # (and whose result is then left out of the cache). The tasks are shielded so that a caller that gets cancelled
+    # doesn’t cancel the lookup for everyone else.
+    lookups = {}
+
+    async def look_up(lookup_key, key, generation, args, kwargs):
+        try:
+            result = await function(*args, **kwargs)
+            store(cache, key, result, generation)
+            return result
+        finally:
+            del lookups[lookup_key]
+
+    @functools.wraps(function)
+    async def cached_function(*args, **kwargs):
+        if not enabled:
+            return await function(*args, **kwargs)
+
+        key = cache_key(function, args, kwargs)
+        result = cache.get(key)
+        if result is not ResultCache.MISSING:
+            return result
+
+        generation = getattr(cache, 'generation', None)
+        lookup_key = (generation, key)
+        if lookup_key not in lookups:
+            lookups[lookup_key] = asyncio.ensure_future(look_up(lookup_key, key, generation, args, kwargs))
+
+        return await asyncio.shield(lookups[lookup_key])
+
+    cached_function.cache = cache
+    return cached_function
+
+
+def invalidates(*cached_functions):
+    """
+    Decorates a DAL function that changes data so that, whenever it succeeds, the caches of
+    the given `@cached` functions are emptied.
+    """
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def invalidating_coroutine_function(*args, **kwargs):
+                result = await function(*args, **kwargs)
+                for cached_function in cached_functions:
+                    cached_function.cache.clear()
+
+                return result
+
+            return invalidating_coroutine_function
+
+        @functools.wraps(function)
+        def invalidating_function(*args, **kwargs):
+            result = function(*args, **kwargs)
+            for cached_function in cached_functions:
+                cached_function.cache.clear()
+
+            return result
+
+        return invalidating_function
+
+    return decorator
+
+
+def cache_statistics():
+    """
+    Returns the size, hits, misses, and evictions of every cache, by module and function name.
+    """
+    return {name: cache.statistics() for name, cache in caches.items() if hasattr(cache, 'statistics')}
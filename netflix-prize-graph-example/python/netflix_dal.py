@@ -1,6 +1,12 @@
+import base64
+import json
 import os
+import re
+import threading
 
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, READ_ACCESS, WRITE_ACCESS
+
+from dal_cache import cached, invalidates
 
 
 # This is for convenience since the `neo4j` user is known to be created by default.
@@ -8,37 +14,157 @@ from neo4j import GraphDatabase
 db_user = os.environ['DB_USER'] if os.environ.get('DB_USER') else 'neo4j'
 
 
+# Helper functions for reading optional settings from environment variables.
+def env_int(name, default):
+    return int(os.environ[name]) if os.environ.get(name) else default
+
+
+def env_float(name, default):
+    return float(os.environ[name]) if os.environ.get(name) else default
+
+
 # The Neo4j documentation calls this object `driver` but the name `db` is used here
 # to provide an analogy across various DAL examples.
-db = GraphDatabase.driver(os.environ['DB_URL'], auth=(db_user, os.environ['DB_PASSWORD']))
+#
+# The driver keeps a _pool_ of connections which are reused from call to call. Its settings matter once many callers
+# (such as the threads of a web service) share this DAL:
+#
+# - DB_POOL_SIZE: the most connections that are kept open at once (per server, in a cluster)
+# - DB_POOL_TIMEOUT: how many seconds to wait for a free connection before giving up
+# - DB_POOL_RECYCLE: how many seconds a connection is used before it is replaced
+# - DB_MAX_RETRY_TIME: for how many seconds a transaction that fails for a passing reason (a lost connection, a
+#   cluster leader switch, a deadlock) is retried before the error is given to the caller
+db = GraphDatabase.driver(
+    os.environ['DB_URL'],
+    auth=(db_user, os.environ['DB_PASSWORD']),
+    max_connection_pool_size=env_int('DB_POOL_SIZE', 100),
+    connection_acquisition_timeout=env_float('DB_POOL_TIMEOUT', 60),
+    max_connection_lifetime=env_float('DB_POOL_RECYCLE', 3600),
+    max_transaction_retry_time=env_float('DB_MAX_RETRY_TIME', 30))
+
+
+# Every DAL function runs its query through `read` or `write`, which run `work(tx, ...)` as a _managed transaction_
+# (with `execute_read` and `execute_write`, which need version 5 of the driver or later):
+# the driver commits it when `work` returns, and if it fails for a passing reason, retries it from the start. So
+# `work` should do nothing but run queries and consume their results.
+#
+# Reads go out in READ mode, which a Neo4j cluster can route to any of its members rather than to the leader. Those
+# members may lag slightly behind, though, so each thread remembers the _bookmark_ of its latest write and its reads
+# wait until the member they run on has caught up to it. A caller thus always sees its own writes.
+latest = threading.local()
+
+
+# The queries below look movies and viewers up by ID, and movies by title. Without indexes on those properties, each
+# such lookup has to check every :Movie or :Viewer node, so the DAL makes sure that the indexes exist before it runs
+# its first query (the first program to use the DAL on a new database creates them).
+#
+# Neo4j builds a new index in the background, and the full-text index must be online before it can be queried, so
+# we wait for that one.
+INDEXES = [
+    'CREATE INDEX movie_id_index IF NOT EXISTS FOR (m:Movie) ON (m.movieId)',
+    'CREATE INDEX viewer_id_index IF NOT EXISTS FOR (v:Viewer) ON (v.viewerId)',
+    'CREATE FULLTEXT INDEX movie_title_index IF NOT EXISTS FOR (m:Movie) ON EACH [m.title]'
+]
+
+indexes_ready = False
+indexes_lock = threading.Lock()
+
+
+def ensure_indexes():
+    global indexes_ready
+    with indexes_lock:
+        if indexes_ready:
+            return
+
+        with db.session(default_access_mode=WRITE_ACCESS) as session:
+            for index in INDEXES:
+                session.run(index).consume()
+
+            session.run("CALL db.awaitIndex('movie_title_index', 300)").consume()
+
+        indexes_ready = True
+
+
+def read(work, *args):
+    if not indexes_ready:
+        ensure_indexes()
+
+    with db.session(default_access_mode=READ_ACCESS, bookmarks=getattr(latest, 'bookmarks', None)) as session:
+        return session.execute_read(work, *args)
+
 
+def write(work, *args):
+    if not indexes_ready:
+        ensure_indexes()
 
+    with db.session(default_access_mode=WRITE_ACCESS) as session:
+        result = session.execute_write(work, *args)
+        latest.bookmarks = session.last_bookmarks()
+        return result
+
+
+# Helper function for search_movies_by_title: turns the words of a title query into a query for the full-text
+# index (which uses Apache Lucene’s query syntax) that matches titles containing words that start with each of them.
+# The index’s analyzer splits titles into lowercase words at punctuation and spaces, leaving the punctuation out, so
+# the query is split the same way: “Spider-Man” becomes `spider* AND man*`. (Punctuation kept in a word, as in
+# `spider\-man*`, would never match.) The words are only letters, digits, and underscores, so nothing in them has a
+# special meaning in Lucene’s syntax—and the lowercase `and`, `or`, and `not` aren’t operators.
+def title_index_query(title_query):
+    words = re.findall(r'\w+', title_query.lower())
+    return ' AND '.join(f'{word}*' for word in words)
+
+
+# Title searches and averages are cached (see dal_cache.py), so repeated lookups of popular movies don’t go
+# back to the database every time.
+#
+# Title searches go through the full-text index, which finds titles by their words instead of checking every title
+# for the query text. So the query matches the _beginnings of words_ in a title, case-insensitively: “star wa”
+# finds “Star Wars” but “ar wars” does not.
+#
+# This query (like the others kept in constants below) is shared with netflix_dal_async.py.
+SEARCH_MOVIES_QUERY = """
+    CALL db.index.fulltext.queryNodes('movie_title_index', $index_query) YIELD node AS m
+    RETURN m
+    ORDER BY m.title
+    LIMIT $limit
+"""
+
+
+@cached
 def search_movies_by_title(title_query, limit=100):
-    with db.session() as session:
-        result = session.run(
-            """
-            MATCH (m:Movie)
-            WHERE toLower(m.title) CONTAINS toLower($title_query)
-            RETURN m
-            ORDER BY m.title
-            LIMIT $limit
-            """,
-            title_query=title_query, # The `query` parameter name is already taken.
-            limit=limit)
+    index_query = title_index_query(title_query)
+    if not index_query:
+        return []
+
+    def search(tx):
+        result = tx.run(SEARCH_MOVIES_QUERY, index_query=index_query, limit=limit)
 
-        # The result needs to be consumed while the session is open.
+        # The result needs to be consumed within the transaction.
         return [record.get('m') for record in result]
 
+    return read(search)
 
+
+# Movies loaded from the dataset carry their Netflix ID as `movieId`, while movies added by `insert_movie` have no
+# `movieId` and go by their Neo4j identity instead. Rather than one MATCH that checks both kinds of ID on every movie,
+# the subquery makes two lookups that can each go straight to their movie—the first through the `movieId` index and
+# the second by identity—and the UNION combines whatever they found.
+AVERAGE_RATING_QUERY = """
+    CALL {
+      MATCH (m:Movie {movieId: $movie_id}) RETURN m
+      UNION
+      MATCH (m:Movie) WHERE id(m) = $identity AND m.movieId IS NULL RETURN m
+    }
+    MATCH (m)<-[r:RATED]-(:Viewer)
+    RETURN avg(r.rating)
+"""
+
+
+@cached
 def get_average_rating_of_movie(movie_id):
-    with db.session() as session:
-        result = session.run(
-            """
-            MATCH (m:Movie)<-[r:RATED]-(:Viewer)
-            WHERE (exists(m.movieId) AND m.movieId = $movie_id) OR
-                  (NOT exists(m.movieId) AND id(m) = $identity)
-            RETURN avg(r.rating)
-            """,
+    def average(tx):
+        result = tx.run(
+            AVERAGE_RATING_QUERY,
             movie_id=str(movie_id), # movie_id is passed as an int so we need to convert to a string here.
             identity=movie_id)
 
@@ -46,32 +172,168 @@ def get_average_rating_of_movie(movie_id):
         # A non-existent movie will yield `None` for this expression.
         return result.single().get('avg(r.rating)')
 
+    return read(average)
 
+
+# Batch version of `get_average_rating_of_movie`: one query for any number of movies, returning a dictionary from
+# each given movie ID to its average rating (`None` for non-existent or unrated movies).
+#
+# `UNWIND` turns the list parameter into one row per movie ID, and everything after it runs once per row—all
+# within the same query. The movies are looked up as in `get_average_rating_of_movie`, and OPTIONAL MATCH keeps a
+# row (with a null average) for movies that have no ratings.
+def get_average_ratings_of_movies(movie_ids):
+    movie_ids = list(movie_ids)
+
+    def averages_of_movies(tx):
+        result = tx.run(
+            """
+            UNWIND $movie_ids AS movie_id
+            CALL {
+              WITH movie_id
+              MATCH (m:Movie {movieId: toString(movie_id)}) RETURN m
+              UNION
+              WITH movie_id
+              MATCH (m:Movie) WHERE id(m) = movie_id AND m.movieId IS NULL RETURN m
+            }
+            OPTIONAL MATCH (m)<-[r:RATED]-(:Viewer)
+            RETURN movie_id, avg(r.rating) AS average
+            """,
+            movie_ids=movie_ids)
+
+        return {record.get('movie_id'): record.get('average') for record in result}
+
+    averages = {movie_id: None for movie_id in movie_ids}
+    averages.update(read(averages_of_movies))
+    return averages
+
+
+# Helper functions for paging: a cursor is the position of the last rating on a page, encoded as an opaque string.
+# Callers just hand it back to get the next page.
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+
+# Returns one page of a viewer’s ratings along with a cursor for the next page, or `None` if this is the last page.
+#
+# The ratings are ordered by (dateRated, title, movie identity)—the identity breaks ties between same-titled movies
+# rated on the same day. The cursor holds those values for the page’s last rating, and the WHERE clause asks for
+# ratings that come _after_ it in that order, rather than having SKIP walk past every earlier rating. So deep pages
+# cost about the same as the first.
+RATINGS_PAGE_QUERY = """
+    MATCH (viewer:Viewer {viewerId: $viewer_id})-[rating:RATED]->(movie:Movie)
+    WHERE $after IS NULL OR
+          rating.dateRated > date($after.dateRated) OR
+          (rating.dateRated = date($after.dateRated) AND
+            (movie.title > $after.title OR (movie.title = $after.title AND id(movie) > $after.identity)))
+    RETURN viewer, rating, movie
+    ORDER BY rating.dateRated, movie.title, id(movie)
+    LIMIT $limit
+"""
+
+
+# Helper functions for get_ratings_page_by_viewer (and its netflix_dal_async.py counterpart): the query’s `after`
+# parameter for a cursor, and the page made from the query’s records, which include one more rating than the page
+# holds—telling us whether there is a next page.
+def ratings_after(cursor):
+    if cursor is None:
+        return None
+
+    date_rated, title, identity = decode_cursor(cursor)
+    return {'dateRated': date_rated, 'title': title, 'identity': identity}
+
+
+def ratings_page(records, limit):
+    if len(records) <= limit:
+        return (records, None)
+
+    last = records[limit - 1]
+    return (records[:limit], encode_cursor([
+        last.get('rating').get('dateRated').iso_format(),
+        last.get('movie').get('title'),
+        last.get('movie').id
+    ]))
+
+
+def get_ratings_page_by_viewer(viewer_id, limit=100, cursor=None):
+    def page(tx):
+        result = tx.run(RATINGS_PAGE_QUERY, viewer_id=viewer_id, after=ratings_after(cursor), limit=limit + 1)
+
+        # The result needs to be consumed within the transaction.
+        return [record for record in result]
+
+    return ratings_page(read(page), limit)
+
+
+# The first page of a viewer’s ratings.
 def get_ratings_by_viewer(viewer_id, limit=100):
-    with db.session() as session:
-        result = session.run(
+    records, _ = get_ratings_page_by_viewer(viewer_id, limit)
+    return records
+
+
+# Batch version of `get_ratings_by_viewer`: one query for any number of viewers, returning a dictionary from each
+# given viewer ID to that viewer’s ratings (up to `limit` each, in the same order as `get_ratings_by_viewer`). Each
+# rating is a map with the same `viewer`, `rating`, and `movie` keys as the records from `get_ratings_by_viewer`.
+#
+# After sorting, `collect` gathers each viewer’s ratings into a list (one row per viewer), and the `[..$limit]`
+# slice keeps the first `limit` of them.
+def get_ratings_by_viewers(viewer_ids, limit=100):
+    viewer_ids = list(viewer_ids)
+
+    def ratings_of_viewers(tx):
+        result = tx.run(
             """
-            MATCH (viewer:Viewer {viewerId: $viewer_id})-[rating:RATED]->(movie:Movie)
-            RETURN viewer, rating, movie
-            ORDER BY rating.dateRated, movie.title
-            LIMIT $limit
+            UNWIND $viewer_ids AS viewer_id
+            MATCH (viewer:Viewer {viewerId: viewer_id})-[rating:RATED]->(movie:Movie)
+            WITH viewer_id, viewer, rating, movie
+            ORDER BY rating.dateRated, movie.title, id(movie)
+            RETURN viewer_id, collect({viewer: viewer, rating: rating, movie: movie})[..$limit] AS ratings
             """,
-            viewer_id=viewer_id,
+            viewer_ids=viewer_ids,
             limit=limit)
 
-        # The result needs to be consumed while the session is open.
-        return [record for record in result]
+        return {record.get('viewer_id'): record.get('ratings') for record in result}
+
+    ratings = {viewer_id: [] for viewer_id in viewer_ids}
+    ratings.update(read(ratings_of_viewers))
+    return ratings
+
+
+# A new movie can show up in title searches, so adding one empties the cached results.
+INSERT_MOVIE_QUERY = """
+    CREATE (insertedMovie:Movie {title: $title, year: $year})
+    RETURN insertedMovie
+"""
 
 
+@invalidates(search_movies_by_title, get_average_rating_of_movie)
 def insert_movie(title, year):
-    with db.session() as session:
-        result = session.run(
+    def create(tx):
+        result = tx.run(INSERT_MOVIE_QUERY, title=title, year=year)
+
+        # This returns the full node so we have its identity and labels.
+        return result.single().get('insertedMovie')
+
+    return write(create)
+
+
+# Batch version of `insert_movie`: adds every movie in `movies`—a list of (title, year) pairs—in a single transaction,
+# returning the new nodes in the same order. `UNWIND` runs the CREATE once per movie within one query, so a catalog
+# update of thousands of movies costs one round trip and one commit, not thousands of each.
+@invalidates(search_movies_by_title, get_average_rating_of_movie)
+def insert_movies(movies):
+    def create(tx):
+        result = tx.run(
             """
-            CREATE (insertedMovie:Movie {title: $title, year: $year})
+            UNWIND $movies AS movie
+            CREATE (insertedMovie:Movie {title: movie.title, year: movie.year})
             RETURN insertedMovie
             """,
-            title=title,
-            year=year)
+            movies=[{'title': title, 'year': year} for title, year in movies])
 
-        # This returns the full node so we have its identity and labels.
-        return result.single().get('insertedMovie')
+        return [record.get('insertedMovie') for record in result]
+
+    return write(create)
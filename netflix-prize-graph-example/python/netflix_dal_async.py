@@ -0,0 +1,143 @@
+"""
+This module is the asyncio counterpart of netflix_dal.py: the same functions with the same results, but written as
+`async def` functions for programs that run on an event loop, such as an aiohttp web service. While one call waits
+for the database, the loop is free to run others, so a single process can have thousands of lookups in flight
+without a thread for each.
+
+It runs on the Neo4j driver’s asyncio API (version 5 or later), with the same environment variables as
+netflix_dal.py, and runs the same queries.
+"""
+
+import asyncio
+import contextvars
+import os
+
+from neo4j import AsyncGraphDatabase, READ_ACCESS, WRITE_ACCESS
+
+import netflix_dal
+from dal_cache import cached, invalidates
+from netflix_dal import AVERAGE_RATING_QUERY, INDEXES, INSERT_MOVIE_QUERY, RATINGS_PAGE_QUERY, SEARCH_MOVIES_QUERY, \
+    db_user, env_float, env_int, ratings_after, ratings_page, title_index_query
+
+db = AsyncGraphDatabase.driver(
+    os.environ['DB_URL'],
+    auth=(db_user, os.environ['DB_PASSWORD']),
+    max_connection_pool_size=env_int('DB_POOL_SIZE', 100),
+    connection_acquisition_timeout=env_float('DB_POOL_TIMEOUT', 60),
+    max_connection_lifetime=env_float('DB_POOL_RECYCLE', 3600),
+    max_transaction_retry_time=env_float('DB_MAX_RETRY_TIME', 30))
+
+
+# A program should call this before its event loop ends, so that the pooled connections are closed properly.
+async def close():
+    await db.close()
+
+
+# netflix_dal.py remembers the bookmark of each _thread’s_ latest write. Here, many callers share one thread, so the
+# bookmarks are kept in a context variable instead: asyncio gives each task its own copy of the context, so each
+# task (one request, typically) reads its own writes.
+latest_bookmarks = contextvars.ContextVar('latest_bookmarks', default=None)
+
+indexes_ready = False
+indexes_lock = asyncio.Lock()
+
+
+async def ensure_indexes():
+    global indexes_ready
+    async with indexes_lock:
+        if indexes_ready:
+            return
+
+        async with db.session(default_access_mode=WRITE_ACCESS) as session:
+            for index in INDEXES:
+                await (await session.run(index)).consume()
+
+            await (await session.run("CALL db.awaitIndex('movie_title_index', 300)")).consume()
+
+        indexes_ready = True
+
+
+async def read(work, *args):
+    if not indexes_ready:
+        await ensure_indexes()
+
+    async with db.session(default_access_mode=READ_ACCESS, bookmarks=latest_bookmarks.get()) as session:
+        return await session.execute_read(work, *args)
+
+
+async def write(work, *args):
+    if not indexes_ready:
+        await ensure_indexes()
+
+    async with db.session(default_access_mode=WRITE_ACCESS) as session:
+        result = await session.execute_write(work, *args)
+        latest_bookmarks.set(await session.last_bookmarks())
+        return result
+
+
+# The cached functions use the same caches as their netflix_dal.py counterparts, which return the same results.
+# A program that uses both modules thus looks each result up only once, and `insert_movie` in either module
+# empties the caches for both.
+@cached(cache=netflix_dal.search_movies_by_title.cache)
+async def search_movies_by_title(title_query, limit=100):
+    index_query = title_index_query(title_query)
+    if not index_query:
+        return []
+
+    async def search(tx):
+        result = await tx.run(SEARCH_MOVIES_QUERY, index_query=index_query, limit=limit)
+        return [record.get('m') async for record in result]
+
+    return await read(search)
+
+
+@cached(cache=netflix_dal.get_average_rating_of_movie.cache)
+async def get_average_rating_of_movie(movie_id):
+    async def average(tx):
+        result = await tx.run(AVERAGE_RATING_QUERY, movie_id=str(movie_id), identity=movie_id)
+        return (await result.single()).get('avg(r.rating)')
+
+    return await read(average)
+
+
+async def get_ratings_page_by_viewer(viewer_id, limit=100, cursor=None):
+    async def page(tx):
+        result = await tx.run(RATINGS_PAGE_QUERY, viewer_id=viewer_id, after=ratings_after(cursor), limit=limit + 1)
+        return [record async for record in result]
+
+    return ratings_page(await read(page), limit)
+
+
+async def get_ratings_by_viewer(viewer_id, limit=100):
+    records, _ = await get_ratings_page_by_viewer(viewer_id, limit)
+    return records
+
+
+@invalidates(search_movies_by_title, get_average_rating_of_movie)
+async def insert_movie(title, year):
+    async def create(tx):
+        result = await tx.run(INSERT_MOVIE_QUERY, title=title, year=year)
+        return (await result.single()).get('insertedMovie')
+
+    return await write(create)
+
+
+DEFAULT_CONCURRENCY = 100
+
+
+async def gather_by_id(function, ids, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Calls `function` (one of the functions above) for every ID in `ids`, concurrently, and returns a dictionary from
+    each ID to its result—for example, `await gather_by_id(get_average_rating_of_movie, movie_ids)`. No more than
+    `concurrency` calls are in progress at once, so that one large batch doesn’t claim every pooled connection while
+    other callers wait.
+    """
+    ids = list(ids)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(id):
+        async with semaphore:
+            return await function(id)
+
+    results = await asyncio.gather(*(call(id) for id in ids))
+    return dict(zip(ids, results))
@@ -0,0 +1,198 @@
+"""
+This module writes and reads a compact _columnar_ binary version of the Netflix Prize ratings.
+
+Instead of one text line per rating, each field gets its own file of fixed-width binary
+numbers—a “column” in database parlance:
+
+- _movie_id.u16_: unsigned 16-bit movie IDs
+- _viewer_id.u32_: unsigned 32-bit viewer IDs
+- _rating.u8_: unsigned 8-bit ratings
+- _date.u16_: unsigned 16-bit dates, stored as the number of days since 1970-01-01
+- _movie_offsets.u64_: for every movie ID `m`, the row at which that movie’s ratings begin;
+  its ratings end where movie `m + 1`’s begin
+
+Rating number `i` consists of the `i`th value of every column. At 9 bytes per rating, the
+full dataset takes around 900 megabytes, and because every value has a fixed width, the
+files can be mapped straight into memory (e.g., with `numpy.memmap`) with no parsing at all.
+
+All values are little-endian. Writing only needs the standard library; reading needs numpy.
+"""
+
+import datetime
+import functools
+import json
+import os
+import sys
+from array import array
+
+DEFAULT_STORE = 'ratings_store'
+
+COLUMNS = {
+    'movie_id': ('H', '<u2', 'movie_id.u16'),
+    'viewer_id': ('I', '<u4', 'viewer_id.u32'),
+    'rating': ('B', '<u1', 'rating.u8'),
+    'date': ('H', '<u2', 'date.u16')
+}
+
+OFFSETS = ('Q', '<u8', 'movie_offsets.u64')
+METADATA = 'store.json'
+
+EPOCH = datetime.date(1970, 1, 1)
+
+# Rows are buffered in memory and written out in batches of this size.
+FLUSH_ROWS = 1 << 20
+
+
+# There are only a couple thousand distinct dates in the dataset, so we remember their
+# conversions rather than parsing the same date string millions of times.
+@functools.lru_cache(maxsize=None)
+def day_number(date_string):
+    return (datetime.date.fromisoformat(date_string) - EPOCH).days
+
+
+def date_string(day_number):
+    return (EPOCH + datetime.timedelta(days=int(day_number))).isoformat()
+
+
+def write_array(values, f):
+    # Arrays are written in the machine’s byte order, so we swap when that isn’t little-endian.
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+
+    values.tofile(f)
+
+
+class RatingsStoreWriter:
+    """
+    Accumulates ratings into a columnar store. Ratings must arrive grouped by movie, with
+    movies in ascending ID order—which is exactly how the combined_data files are laid out.
+    """
+    def __init__(self, directory=DEFAULT_STORE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.files = {
+            name: open(os.path.join(directory, filename), 'wb')
+            for name, (_, _, filename) in COLUMNS.items()
+        }
+
+        self.buffers = {name: array(typecode) for name, (typecode, _, _) in COLUMNS.items()}
+        self.offsets = array(OFFSETS[0], [0])  # There is no movie 0, so it starts (and ends) at row 0.
+        self.row_count = 0
+        self.current_movie_id = 0
+
+    def start_movie(self, movie_id):
+        if movie_id <= self.current_movie_id:
+            raise ValueError(f'Movie {movie_id} is out of order: ratings must be grouped by ascending movie ID.')
+
+        # Movies that never appear simply get an empty range of rows.
+        while len(self.offsets) <= movie_id:
+            self.offsets.append(self.row_count)
+
+        self.current_movie_id = movie_id
+
+    def add_rating(self, viewer_id, rating, date_rated):
+        self.buffers['movie_id'].append(self.current_movie_id)
+        self.buffers['viewer_id'].append(viewer_id)
+        self.buffers['rating'].append(rating)
+        self.buffers['date'].append(day_number(date_rated))
+        self.row_count = self.row_count + 1
+
+        if len(self.buffers['rating']) >= FLUSH_ROWS:
+            self.flush()
+
+    def add_ratings(self, viewer_ids, ratings, day_numbers):
+        """
+        Adds many ratings for the current movie at once, given as equal-length sequences
+        (typically arrays) of viewer IDs, ratings, and day numbers.
+        """
+        self.buffers['movie_id'].extend(array('H', [self.current_movie_id]) * len(ratings))
+        self.buffers['viewer_id'].extend(viewer_ids)
+        self.buffers['rating'].extend(ratings)
+        self.buffers['date'].extend(day_numbers)
+        self.row_count = self.row_count + len(ratings)
+
+        if len(self.buffers['rating']) >= FLUSH_ROWS:
+            self.flush()
+
+    def flush(self):
+        for name, values in self.buffers.items():
+            write_array(values, self.files[name])
+            self.buffers[name] = array(values.typecode)
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+        # One last offset marks the end of the final movie’s ratings.
+        self.offsets.append(self.row_count)
+        with open(os.path.join(self.directory, OFFSETS[2]), 'wb') as f:
+            write_array(self.offsets, f)
+
+        with open(os.path.join(self.directory, METADATA), 'w') as f:
+            json.dump({
+                'rows': self.row_count,
+                'max_movie_id': self.current_movie_id,
+                'date_epoch': EPOCH.isoformat()
+            }, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_info):
+        self.close()
+
+
+class RatingsStore:
+    """
+    Read-only, memory-mapped view of a columnar store. Each column is available as a numpy
+    array attribute (`movie_id`, `viewer_id`, `rating`, `date`), along with `offsets`.
+    """
+    def __init__(self, directory=DEFAULT_STORE):
+        # numpy is only needed for reading, so it is only imported here.
+        import numpy
+
+        def map_file(dtype, filename):
+            path = os.path.join(directory, filename)
+
+            # numpy refuses to map empty files, so we substitute an empty array.
+            if os.path.getsize(path) == 0:
+                return numpy.empty(0, dtype=dtype)
+
+            return numpy.memmap(path, dtype=dtype, mode='r')
+
+        self.directory = directory
+        for name, (_, dtype, filename) in COLUMNS.items():
+            setattr(self, name, map_file(dtype, filename))
+
+        self.offsets = map_file(OFFSETS[1], OFFSETS[2])
+
+    @property
+    def max_movie_id(self):
+        return len(self.offsets) - 2
+
+    def __len__(self):
+        return len(self.rating)
+
+    def movie_range(self, movie_id):
+        """
+        Returns the (start, end) rows of the given movie’s ratings, or None if the store has
+        no such movie.
+        """
+        if movie_id < 1 or movie_id > self.max_movie_id:
+            return None
+
+        return (int(self.offsets[movie_id]), int(self.offsets[movie_id + 1]))
+
+    def ratings_of_movie(self, movie_id):
+        """
+        Returns the (viewer_id, rating, date) columns for the given movie as array slices—no
+        data is copied—or None if the store has no such movie.
+        """
+        movie_range = self.movie_range(movie_id)
+        if movie_range is None:
+            return None
+
+        start, end = movie_range
+        return (self.viewer_id[start:end], self.rating[start:end], self.date[start:end])
@@ -0,0 +1,125 @@
+"""
+This module holds the SQL-generating pieces shared by movie_loader.py and rating_loader.py for
+environments where `COPY` isn’t an option.
+
+By default, the loaders emit one `INSERT` per row, and because _psql_ runs in autocommit mode,
+every one of those statements is also its own transaction. Two options cut that overhead:
+
+- `--batch-size N` groups N rows into each multi-row `INSERT ... VALUES (...), (...), ...;`
+- `--commit-every N` wraps every N of those statements in `BEGIN`/`COMMIT`
+
+Two more options reduce the work the database does _per row_ during a bulk load, at the cost of
+safety while the load is running:
+
+- `--unlogged` switches the table to `UNLOGGED` (no write-ahead log) for the duration of the
+  load, switching it back to `LOGGED` afterwards. An unlogged table is emptied if the server
+  crashes, so only use this on a table that can be reloaded from scratch.
+- `--drop-indexes` drops the table’s indexes (other than those backing constraints like primary
+  keys) before the load and recreates them afterwards—building an index once at the end is much
+  cheaper than updating it 100 million times. The index definitions are saved in a temporary
+  table, so whatever indexes the table has are the ones that come back.
+"""
+
+
+def add_batching_arguments(parser):
+    """
+    Adds the options described above to a loader’s argument parser.
+    """
+    parser.add_argument('--batch-size', type=int, default=1, metavar='N',
+        help='rows per INSERT statement (default: 1)')
+    parser.add_argument('--commit-every', type=int, default=0, metavar='N',
+        help='wrap every N INSERT statements in BEGIN/COMMIT (default: 0, meaning autocommit each one)')
+    parser.add_argument('--unlogged', action='store_true',
+        help='make the table UNLOGGED during the load (its contents are lost if the server crashes mid-load)')
+    parser.add_argument('--drop-indexes', action='store_true',
+        help='drop the table’s non-constraint indexes before the load and recreate them afterwards')
+
+
+def insert_statements(table, values, batch_size=1, commit_every=0):
+    """
+    Returns the SQL text that inserts the given rows into `table`. Each row in `values` is an
+    already-formatted SQL tuple such as `(1, 2003, 'Dinosaur Planet')`.
+    """
+    statements = []
+    batch = []
+    batch_count = 0
+
+    def end_batch():
+        nonlocal batch, batch_count
+        if commit_every > 0 and batch_count % commit_every == 0:
+            statements.append('BEGIN;\n')
+
+        statements.append(f'INSERT INTO {table} VALUES{", ".join(batch)};\n')
+        batch = []
+        batch_count = batch_count + 1
+        if commit_every > 0 and batch_count % commit_every == 0:
+            statements.append('COMMIT;\n')
+
+    for value in values:
+        batch.append(value)
+        if len(batch) >= batch_size:
+            end_batch()
+
+    if batch:
+        end_batch()
+
+    # Close off a transaction that didn’t get its full number of statements.
+    if commit_every > 0 and batch_count % commit_every != 0:
+        statements.append('COMMIT;\n')
+
+    return ''.join(statements)
+
+
+def saved_indexes_table(table):
+    return f'{table}_load_indexes'
+
+
+def before_load(table, unlogged=False, drop_indexes=False):
+    """
+    Returns the SQL to run before bulk-loading `table` with the given options.
+    """
+    statements = []
+    if drop_indexes:
+        saved_indexes = saved_indexes_table(table)
+        statements.append(f"""CREATE TEMPORARY TABLE {saved_indexes} AS
+  SELECT indexname, indexdef FROM pg_indexes
+  WHERE schemaname = current_schema() AND tablename = '{table}'
+    AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = '{table}'::regclass);
+DO $$
+DECLARE saved RECORD;
+BEGIN
+  FOR saved IN SELECT indexname FROM {saved_indexes} LOOP
+    EXECUTE format('DROP INDEX %I', saved.indexname);
+  END LOOP;
+END
+$$;
+""")
+
+    if unlogged:
+        statements.append(f'ALTER TABLE {table} SET UNLOGGED;\n')
+
+    return ''.join(statements)
+
+
+def after_load(table, unlogged=False, drop_indexes=False):
+    """
+    Returns the SQL that undoes `before_load` once the load is done.
+    """
+    statements = []
+    if unlogged:
+        statements.append(f'ALTER TABLE {table} SET LOGGED;\n')
+
+    if drop_indexes:
+        saved_indexes = saved_indexes_table(table)
+        statements.append(f"""DO $$
+DECLARE saved RECORD;
+BEGIN
+  FOR saved IN SELECT indexdef FROM {saved_indexes} LOOP
+    EXECUTE saved.indexdef;
+  END LOOP;
+END
+$$;
+DROP TABLE {saved_indexes};
+""")
+
+    return ''.join(statements)
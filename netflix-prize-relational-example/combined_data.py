@@ -0,0 +1,216 @@
+"""
+This module holds the pieces that every program reading the Netflix Prize combined_data files
+needs: the list of files, how to read their ratings quickly, and how to spread that reading
+across several processes.
+
+Reading: `csv.reader` plus a regular expression match on every one of 100 million lines adds
+up—a regex call and a list allocation per rating. The combined_data format is simple enough
+that we don’t need either. The readers here pull the file in large binary blocks, decode each
+block once, split it into lines, and recognize movie lines by their trailing colon. Rating
+lines are only split into fields if the caller needs fields:
+
+- `read_movies` yields (movie_id, rating_lines) per movie, where the lines are the untouched
+  `viewer_id,rating,date` strings—handy for programs that mostly copy text through
+- `read_movie_slices` does the same in slices of at most N lines, each one yielded as soon as
+  its lines are read, so that even the most popular movie never has to be in memory at once
+- `read_ratings` yields a (movie_id, viewer_id, rating, date) tuple per rating
+- `rating_columns` turns a movie’s rating lines into compact arrays in one go
+
+Splitting: the combined_data files can be split cleanly because every file, and thus every
+movie’s block of ratings, starts with a `<movie_id>:` line. `find_chunks` cuts each file into
+byte ranges of roughly equal size, each one starting exactly on such a line, so that each
+range can be processed on its own—including in a different process. `map_chunks` then
+applies a function to every range, either one after another or in a process pool, and hands
+back the results _in file order_ so that output comes out the same either way.
+
+benchmark_parser.py (in the file example folder) measures how fast all of this is.
+
+Identical copies of this module live in each example folder that reads combined_data, so
+that every example stays self-contained.
+"""
+
+import multiprocessing
+import os
+from array import array
+
+# For simplicity, we assume that the program runs where the files are located.
+SOURCES = [
+    'combined_data_1.txt',
+    'combined_data_2.txt',
+    'combined_data_3.txt',
+    'combined_data_4.txt'
+]
+
+# Each chunk holds around this many bytes of source data (a bit more, so that it can end
+# right before a movie line). This keeps each chunk’s results comfortably small in memory.
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+
+# The readers request data from the file this many bytes at a time.
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def is_movie_line(line):
+    return line.rstrip().endswith(b':')
+
+
+def find_chunks(sources=SOURCES, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields (source, start, end) byte ranges that together cover every file, where each range
+    starts at the beginning of a `<movie_id>:` line.
+    """
+    for source in sources:
+        size = os.path.getsize(source)
+        with open(source, 'rb') as f:
+            start = 0
+            while start < size:
+                end = size
+                if start + chunk_size < size:
+                    # Jump ahead, finish the line that we landed in, then keep reading until
+                    # the next movie line, which is where the next chunk will start.
+                    f.seek(start + chunk_size)
+                    f.readline()
+                    while True:
+                        position = f.tell()
+                        line = f.readline()
+                        if not line:
+                            break
+
+                        if is_movie_line(line):
+                            end = position
+                            break
+
+                yield (source, start, end)
+                start = end
+
+
+def read_lines(chunk):
+    """
+    Yields lists of the complete lines in the given chunk—a (source, start, end) byte range,
+    with `end` as None meaning “to the end of the file”—one block’s worth at a time.
+    """
+    source, start, end = chunk
+    with open(source, 'rb') as f:
+        f.seek(start)
+        remaining = end - start if end is not None else None
+        leftover = b''
+        while remaining is None or remaining > 0:
+            block = f.read(BLOCK_SIZE if remaining is None else min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+
+            if remaining is not None:
+                remaining = remaining - len(block)
+
+            # A block usually ends partway through a line; that partial line is held back
+            # and glued onto the front of the next block.
+            block = leftover + block
+            cut = block.rfind(b'\n') + 1
+            leftover = block[cut:]
+
+            # Windows-style line endings, if any, leave a '\r' at the end of each line. We
+            # strip those here once rather than on every line later.
+            lines = block[:cut].decode('ascii').replace('\r', '').split('\n')
+            lines.pop()  # The block ends with '\n', so the last “line” is always empty.
+            yield lines
+
+        if leftover.strip():
+            yield [leftover.decode('ascii').strip()]
+
+
+def read_movies(chunk):
+    """
+    Yields (movie_id, rating_lines) for every movie in the given chunk, where `movie_id` is an
+    int and `rating_lines` is a list of the movie’s `viewer_id,rating,date` lines as strings.
+    """
+    movie_id = None
+    rating_lines = []
+    for lines in read_lines(chunk):
+        for line in lines:
+            if line[-1:] == ':':
+                if movie_id is not None:
+                    yield (movie_id, rating_lines)
+
+                movie_id = int(line[:-1])
+                rating_lines = []
+            elif line:
+                rating_lines.append(line)
+
+    if movie_id is not None:
+        yield (movie_id, rating_lines)
+
+
+def read_movie_slices(chunk, size):
+    """
+    Yields (movie_id, slice_number, rating_lines) for every movie in the given chunk, like
+    `read_movies` but with at most `size` of the movie’s lines at a time. Slices are numbered
+    from 0 within each movie, and each one is yielded as soon as its lines have been read. A
+    movie without ratings yields a single, empty slice.
+    """
+    movie_id = None
+    slice_number = 0
+    rating_lines = []
+    for lines in read_lines(chunk):
+        for line in lines:
+            if line[-1:] == ':':
+                if movie_id is not None:
+                    yield (movie_id, slice_number, rating_lines)
+
+                movie_id = int(line[:-1])
+                slice_number = 0
+                rating_lines = []
+            elif line:
+                if len(rating_lines) == size:
+                    yield (movie_id, slice_number, rating_lines)
+                    slice_number = slice_number + 1
+                    rating_lines = []
+
+                rating_lines.append(line)
+
+    if movie_id is not None:
+        yield (movie_id, slice_number, rating_lines)
+
+
+def read_ratings(chunk):
+    """
+    Yields a (movie_id, viewer_id, rating, date) tuple for every rating in the given chunk.
+    IDs and ratings are ints; the date stays an ISO 8601 string.
+    """
+    for movie_id, rating_lines in read_movies(chunk):
+        for line in rating_lines:
+            viewer_id, rating, date = line.split(',')
+            yield (movie_id, int(viewer_id), int(rating), date)
+
+
+def rating_columns(rating_lines):
+    """
+    Converts a movie’s rating lines into (viewer_ids, ratings, dates): an unsigned 32-bit
+    array, an unsigned 8-bit array, and a list of ISO 8601 date strings.
+    """
+    # Joining everything with commas gives one flat list of fields, which can then be sliced
+    # into columns and converted in bulk instead of field by field.
+    fields = ','.join(rating_lines).split(',') if rating_lines else []
+    return (array('I', map(int, fields[0::3])), array('B', map(int, fields[1::3])), fields[2::3])
+
+
+def map_chunks(function, workers=1, sources=SOURCES, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Applies `function` to every chunk of the given files and yields the results in file order.
+    With more than one worker, chunks are processed in a pool of that many processes, so
+    `function` must be defined at the top level of its module—and programs that use this
+    need the `if __name__ == '__main__':` guard so that worker processes can import them.
+    """
+    chunks = find_chunks(sources, chunk_size)
+    if workers <= 1:
+        yield from map(function, chunks)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(function, chunks)
+
+
+def add_workers_argument(parser):
+    """
+    Adds the `--workers` option shared by all of the programs that use this module.
+    """
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+        help=f'number of processes to read with (this machine has {os.cpu_count()} cores; default: 1)')
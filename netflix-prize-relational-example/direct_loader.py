@@ -0,0 +1,150 @@
+"""
+This program loads the Netflix Prize ratings _directly_ into PostgreSQL, instead of printing
+SQL for `psql` to run. It connects with the same `DB_URL` environment variable as the DAL in
+python/netflix_dal.py:
+
+    DB_URL=postgres://localhost/postgres python3 direct_loader.py --workers 8
+
+The combined_data files are cut into chunks that each start on a movie line (see
+combined_data.py), and each worker process streams chunks into the database over its own
+connection using `COPY`, so several chunks load at once.
+
+Each chunk is loaded in a single transaction, which also records the chunk in a
+`rating_load_progress` table. A chunk is therefore either completely loaded and recorded, or
+not loaded at all—so if the load is interrupted, running the program again picks up where it
+left off, skipping the chunks (and thus the movies) that were already committed. Resuming
+relies on the chunks coming out the same way, so use the same `--chunk-size` as before.
+"""
+
+import argparse
+import io
+import os
+import re
+import time
+from multiprocessing import Pool
+
+import psycopg2
+
+from combined_data import DEFAULT_CHUNK_SIZE, SOURCES, add_workers_argument, find_chunks
+from rating_loader import COPY_COMMAND, copy_text
+
+PROGRESS_TABLE = 'rating_load_progress'
+
+
+def connection_url():
+    # The DAL’s URL may name an SQLAlchemy driver (e.g., `postgresql+psycopg2://`), which
+    # psycopg2 itself doesn’t understand, so we take that part out.
+    return re.sub(r'^(\w+)\+\w+://', r'\1://', os.environ['DB_URL'])
+
+
+def prepare_progress_table(connection, truncate):
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} (
+              source VARCHAR,
+              start_offset BIGINT,
+              end_offset BIGINT,
+              rating_count BIGINT,
+              loaded_at TIMESTAMP DEFAULT now(),
+              PRIMARY KEY (source, start_offset)
+            )
+        """)
+
+        if truncate:
+            cursor.execute(f'TRUNCATE rating, {PROGRESS_TABLE}')
+
+            # TRUNCATE doesn’t fire the triggers that maintain the per-movie rating summaries
+            # (see migrations/002_movie_rating_stats.sql), so we empty those too if they exist.
+            cursor.execute("SELECT to_regclass('movie_rating_stats') IS NOT NULL")
+            if cursor.fetchone()[0]:
+                cursor.execute('TRUNCATE movie_rating_stats')
+
+        cursor.execute(f'SELECT source, start_offset, end_offset FROM {PROGRESS_TABLE}')
+        loaded = set(cursor.fetchall())
+
+    connection.commit()
+    return loaded
+
+
+def chunks_to_load(loaded, chunk_size):
+    """
+    Returns the chunks that haven’t been loaded yet. A chunk that only partially overlaps a
+    loaded one means that the chunk size has changed since the last run, and we stop rather
+    than risk loading some ratings twice.
+    """
+    remaining = []
+    for chunk in find_chunks(SOURCES, chunk_size):
+        if chunk in loaded:
+            continue
+
+        source, start, end = chunk
+        for loaded_source, loaded_start, loaded_end in loaded:
+            if loaded_source == source and loaded_start < end and start < loaded_end:
+                raise SystemExit(f'{source} was previously loaded in different chunks; '
+                    'please use the same --chunk-size as the interrupted load.')
+
+        remaining.append(chunk)
+
+    return remaining
+
+
+# Each worker process opens one connection when it starts and keeps it for all of its chunks.
+connection = None
+
+
+def open_connection():
+    global connection
+    connection = psycopg2.connect(connection_url())
+
+
+def load_chunk(chunk):
+    start_time = time.perf_counter()
+    source, start, end = chunk
+    rows = copy_text(chunk)
+    rating_count = rows.count('\n')
+
+    # The COPY and the progress record commit together, or not at all.
+    with connection.cursor() as cursor:
+        cursor.copy_expert(COPY_COMMAND, io.StringIO(rows))
+        cursor.execute(
+            f'INSERT INTO {PROGRESS_TABLE} (source, start_offset, end_offset, rating_count) VALUES (%s, %s, %s, %s)',
+            (source, start, end, rating_count))
+
+    connection.commit()
+    return (chunk, rating_count, time.perf_counter() - start_time)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Loads the combined_data ratings directly into PostgreSQL at DB_URL.')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, metavar='BYTES',
+        help=f'approximate bytes of source data per transaction (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--truncate', action='store_true',
+        help='empty the rating table and the load progress first, instead of resuming')
+    add_workers_argument(parser)
+    args = parser.parse_args()
+
+    setup_connection = psycopg2.connect(connection_url())
+    loaded = prepare_progress_table(setup_connection, args.truncate)
+    setup_connection.close()
+
+    chunks = chunks_to_load(loaded, args.chunk_size)
+    total_bytes = sum(end - start for _, start, end in chunks)
+    if loaded:
+        print(f'Resuming: {len(loaded)} chunks were already loaded; {len(chunks)} to go.')
+
+    loaded_bytes = 0
+    loaded_ratings = 0
+    load_start = time.perf_counter()
+
+    # Chunks can be committed in any order, so we take results as soon as they are ready.
+    with Pool(max(args.workers, 1), initializer=open_connection) as pool:
+        for (source, start, end), rating_count, seconds in pool.imap_unordered(load_chunk, chunks):
+            loaded_bytes = loaded_bytes + end - start
+            loaded_ratings = loaded_ratings + rating_count
+            elapsed = time.perf_counter() - load_start
+
+            # Provide some feedback, including overall throughput so far.
+            print(f'{source} [{start}:{end}]: {rating_count} ratings in {seconds:.1f}s —\
+ {loaded_bytes * 100 / total_bytes:.1f}% done, {loaded_ratings / elapsed:.0f} ratings/s overall')
+
+    print(f'Loaded {loaded_ratings} ratings in {time.perf_counter() - load_start:.1f}s.')
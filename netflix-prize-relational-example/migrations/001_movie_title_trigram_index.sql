@@ -0,0 +1,9 @@
+-- Trigram index for movie title searches.
+--
+-- A B-tree index can’t help with `title ILIKE '%something%'` because the match can start
+-- anywhere in the title. The pg_trgm extension breaks text into three-character pieces
+-- (“trigrams”), and a GIN index over those lets PostgreSQL find titles containing a given
+-- substring—or titles that are merely _similar_ to a query—without scanning every movie.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS movie_title_trgm_idx ON movie USING GIN (title gin_trgm_ops);
@@ -0,0 +1,100 @@
+-- Per-movie rating summaries.
+--
+-- Averaging a movie’s ratings means visiting every one of its rows in `rating`—thousands of
+-- them for a popular movie, out of 100 million overall. Instead, `movie_rating_stats` keeps
+-- one row per movie with its rating count, rating sum, and how many of each rating (1–5) it
+-- got, so an average is a single-row lookup: `rating_sum / rating_count`.
+CREATE TABLE IF NOT EXISTS movie_rating_stats (
+  movie_id INT PRIMARY KEY REFERENCES movie(id),
+  rating_count BIGINT NOT NULL DEFAULT 0,
+  rating_sum BIGINT NOT NULL DEFAULT 0,
+  rating_1_count BIGINT NOT NULL DEFAULT 0,
+  rating_2_count BIGINT NOT NULL DEFAULT 0,
+  rating_3_count BIGINT NOT NULL DEFAULT 0,
+  rating_4_count BIGINT NOT NULL DEFAULT 0,
+  rating_5_count BIGINT NOT NULL DEFAULT 0
+);
+
+-- The summaries are kept up to date by _statement-level_ triggers on `rating`. Each one sees
+-- all of the rows that its statement changed (the `new_rows`/`old_rows` transition tables),
+-- totals them per movie, and applies those totals to `movie_rating_stats` in one go. A
+-- multi-row `INSERT` or a `COPY` therefore costs one update per movie, not one per rating.
+-- Ratings that are NULL are left out, just as `avg(rating)` leaves them out.
+CREATE OR REPLACE FUNCTION update_movie_rating_stats() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO movie_rating_stats
+      SELECT movie_id, count(rating), coalesce(sum(rating), 0),
+        count(*) FILTER (WHERE rating = 1), count(*) FILTER (WHERE rating = 2),
+        count(*) FILTER (WHERE rating = 3), count(*) FILTER (WHERE rating = 4),
+        count(*) FILTER (WHERE rating = 5)
+      FROM new_rows WHERE movie_id IS NOT NULL GROUP BY movie_id
+    ON CONFLICT (movie_id) DO UPDATE SET
+      rating_count = movie_rating_stats.rating_count + EXCLUDED.rating_count,
+      rating_sum = movie_rating_stats.rating_sum + EXCLUDED.rating_sum,
+      rating_1_count = movie_rating_stats.rating_1_count + EXCLUDED.rating_1_count,
+      rating_2_count = movie_rating_stats.rating_2_count + EXCLUDED.rating_2_count,
+      rating_3_count = movie_rating_stats.rating_3_count + EXCLUDED.rating_3_count,
+      rating_4_count = movie_rating_stats.rating_4_count + EXCLUDED.rating_4_count,
+      rating_5_count = movie_rating_stats.rating_5_count + EXCLUDED.rating_5_count;
+  END IF;
+
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    UPDATE movie_rating_stats SET
+      rating_count = movie_rating_stats.rating_count - removed.rating_count,
+      rating_sum = movie_rating_stats.rating_sum - removed.rating_sum,
+      rating_1_count = movie_rating_stats.rating_1_count - removed.rating_1_count,
+      rating_2_count = movie_rating_stats.rating_2_count - removed.rating_2_count,
+      rating_3_count = movie_rating_stats.rating_3_count - removed.rating_3_count,
+      rating_4_count = movie_rating_stats.rating_4_count - removed.rating_4_count,
+      rating_5_count = movie_rating_stats.rating_5_count - removed.rating_5_count
+    FROM (
+      SELECT movie_id, count(rating) AS rating_count, coalesce(sum(rating), 0) AS rating_sum,
+        count(*) FILTER (WHERE rating = 1) AS rating_1_count,
+        count(*) FILTER (WHERE rating = 2) AS rating_2_count,
+        count(*) FILTER (WHERE rating = 3) AS rating_3_count,
+        count(*) FILTER (WHERE rating = 4) AS rating_4_count,
+        count(*) FILTER (WHERE rating = 5) AS rating_5_count
+      FROM old_rows WHERE movie_id IS NOT NULL GROUP BY movie_id
+    ) AS removed
+    WHERE movie_rating_stats.movie_id = removed.movie_id;
+  END IF;
+
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- A trigger with transition tables can only fire on one kind of event, hence three of them.
+DROP TRIGGER IF EXISTS movie_rating_stats_insert ON rating;
+CREATE TRIGGER movie_rating_stats_insert AFTER INSERT ON rating
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION update_movie_rating_stats();
+
+DROP TRIGGER IF EXISTS movie_rating_stats_update ON rating;
+CREATE TRIGGER movie_rating_stats_update AFTER UPDATE ON rating
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION update_movie_rating_stats();
+
+DROP TRIGGER IF EXISTS movie_rating_stats_delete ON rating;
+CREATE TRIGGER movie_rating_stats_delete AFTER DELETE ON rating
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION update_movie_rating_stats();
+
+-- Recomputes every summary from scratch. Use this after loading ratings with the triggers
+-- disabled (or after `TRUNCATE`, which doesn’t fire them). The `SHARE` lock holds off other
+-- changes to `rating` until the transaction that called this commits, so that none are missed.
+CREATE OR REPLACE FUNCTION rebuild_movie_rating_stats() RETURNS void AS $$
+BEGIN
+  LOCK TABLE rating IN SHARE MODE;
+  DELETE FROM movie_rating_stats;
+  INSERT INTO movie_rating_stats
+    SELECT movie_id, count(rating), coalesce(sum(rating), 0),
+      count(*) FILTER (WHERE rating = 1), count(*) FILTER (WHERE rating = 2),
+      count(*) FILTER (WHERE rating = 3), count(*) FILTER (WHERE rating = 4),
+      count(*) FILTER (WHERE rating = 5)
+    FROM rating WHERE movie_id IS NOT NULL GROUP BY movie_id;
+END
+$$ LANGUAGE plpgsql;
+
+-- Summarize whatever ratings are already there.
+SELECT rebuild_movie_rating_stats();
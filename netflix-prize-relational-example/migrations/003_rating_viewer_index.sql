@@ -0,0 +1,7 @@
+-- Index for looking up a viewer’s ratings in date order.
+--
+-- `get_ratings_by_viewer` and friends look ratings up by viewer and page through them by
+-- date. With this index, PostgreSQL can jump straight to one viewer’s ratings—and, when
+-- resuming from a cursor, straight to the first date of the next page—instead of scanning
+-- all 100 million ratings.
+CREATE INDEX IF NOT EXISTS rating_viewer_date_idx ON rating (viewer_id, date_rated, movie_id);
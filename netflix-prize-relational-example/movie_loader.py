@@ -1,7 +1,3 @@
-import csv
-import re
-import sys
-
 """
 This program generates direct SQL statements from the source Netflix Prize files in order
 to populate a relational database with those files’ data.
@@ -11,10 +7,20 @@ some kind of database library for the loading process, instead passing the state
 directly into a database command line utility such as `psql`.
 """
 
-# For simplicity, we assume that the program runs where the files are located.
-MOVIE_SOURCE = 'movie_titles.csv'
-with open(MOVIE_SOURCE, 'r+', encoding='iso-8859-1') as f:
-    reader = csv.reader(f)
+import argparse
+import csv
+import re
+import sys
+
+from bulk_sql import add_batching_arguments, after_load, before_load, insert_statements
+
+parser = argparse.ArgumentParser(description='Prints SQL that loads the movie_titles.csv movies.')
+add_batching_arguments(parser)
+args = parser.parse_args()
+
+
+# Each movie becomes an SQL tuple for an INSERT statement.
+def movie_values(reader):
     for row in reader:
         id = row[0]
         year = 'null' if row[1] == 'NULL' else int(row[1])
@@ -22,7 +28,18 @@ with open(MOVIE_SOURCE, 'r+', encoding='iso-8859-1') as f:
 
         # Watch out---titles might have apostrophes!
         title = title.replace("'", "''")
-        print(f'INSERT INTO movie VALUES({id}, {year}, \'{title}\');')
+        yield f'({id}, {year}, \'{title}\')'
+
+
+sys.stdout.write(before_load('movie', args.unlogged, args.drop_indexes))
+
+# For simplicity, we assume that the program runs where the files are located.
+MOVIE_SOURCE = 'movie_titles.csv'
+with open(MOVIE_SOURCE, 'r+', encoding='iso-8859-1') as f:
+    reader = csv.reader(f)
+    sys.stdout.write(insert_statements('movie', movie_values(reader), args.batch_size, args.commit_every))
+
+sys.stdout.write(after_load('movie', args.unlogged, args.drop_indexes))
 
 # We wrap up by emitting an SQL statement that will update the database’s movie ID
 # counter based on the largest one that has been loaded so far.
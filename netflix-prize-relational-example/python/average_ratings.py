@@ -0,0 +1,20 @@
+import sys
+
+from netflix_dal import get_average_ratings_of_movies
+
+if len(sys.argv) < 2:
+    print('Usage: average_ratings <movie_id> [<movie_id> ...]')
+    exit(1)
+
+movie_ids = sys.argv[1:]
+try:
+    # All of the averages come back from a single query.
+    result = get_average_ratings_of_movies([int(movie_id) for movie_id in movie_ids])
+
+    for movie_id, average in result.items():
+        if average is None:
+            print(f'Movie ID {movie_id} does not exist or has no ratings.')
+        else:
+            print(f'The average rating of movie ID {movie_id} is {average}.')
+except ValueError:
+    print(f'Sorry, something went wrong. Please ensure that “{" ".join(movie_ids)}” are all valid movie IDs.')
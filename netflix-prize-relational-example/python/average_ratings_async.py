@@ -0,0 +1,29 @@
+import asyncio
+import sys
+
+from netflix_dal_async import close, gather_by_id, get_average_rating_of_movie
+
+if len(sys.argv) < 2:
+    print('Usage: average_ratings_async <movie_id> [<movie_id> ...]')
+    exit(1)
+
+
+async def main(movie_ids):
+    try:
+        # The averages are looked up concurrently, one query per movie.
+        return await gather_by_id(get_average_rating_of_movie, movie_ids)
+    finally:
+        await close()
+
+
+movie_ids = sys.argv[1:]
+try:
+    result = asyncio.run(main([int(movie_id) for movie_id in movie_ids]))
+
+    for movie_id, average in result.items():
+        if average is None:
+            print(f'Movie ID {movie_id} does not exist or has no ratings.')
+        else:
+            print(f'The average rating of movie ID {movie_id} is {average}.')
+except ValueError:
+    print(f'Sorry, something went wrong. Please ensure that “{" ".join(movie_ids)}” are all valid movie IDs.')
@@ -0,0 +1,39 @@
+"""
+This program applies the SQL files in the ../migrations folder that haven’t been applied to
+the database yet, in file name order, recording each one in a `schema_migration` table. It
+is safe to run repeatedly: already-applied migrations are skipped.
+"""
+
+import os
+
+from sqlalchemy import text
+
+from netflix_dal import db
+
+MIGRATIONS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations')
+
+with db.begin() as connection:
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migration (
+          name VARCHAR PRIMARY KEY,
+          applied_at TIMESTAMP DEFAULT now()
+        )
+    """))
+
+    applied = {row[0] for row in connection.execute(text('SELECT name FROM schema_migration'))}
+
+for name in sorted(os.listdir(MIGRATIONS_FOLDER)):
+    if not name.endswith('.sql') or name in applied:
+        continue
+
+    with open(os.path.join(MIGRATIONS_FOLDER, name)) as f:
+        migration = f.read()
+
+    # Each migration and its record are committed together, so a failed migration can just
+    # be fixed and re-run.
+    print(f'Applying {name}...')
+    with db.begin() as connection:
+        connection.exec_driver_sql(migration)
+        connection.execute(text('INSERT INTO schema_migration (name) VALUES (:name)'), {'name': name})
+
+print('The database is up to date.')
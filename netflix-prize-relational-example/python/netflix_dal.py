@@ -1,36 +1,176 @@
+import base64
+import datetime
+import functools
+import json
 import os
 
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Date, ForeignKey, Sequence
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Date, ForeignKey, Sequence, ARRAY, \
+    any_, literal, and_, tuple_
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.sql import select, func
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.sql import select, func, text
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship, contains_eager
 
-db = create_engine(os.environ['DB_URL'])
-metadata = MetaData(db)
-movie_table = Table('movie', metadata, autoload=True)
-rating_table = Table('rating', metadata, autoload=True)
+from dal_cache import cached, invalidates
+
+
+# Helper functions for reading optional settings from environment variables.
+def env_int(name, default):
+    return int(os.environ[name]) if os.environ.get(name) else default
+
+
+def env_flag(name, default):
+    return os.environ[name].lower() in ('1', 'true', 'yes') if os.environ.get(name) else default
+
+
+# The engine keeps a _pool_ of database connections which are reused from call to call. Its
+# settings matter once many callers (such as the threads of a web service) share this DAL:
+#
+# - DB_POOL_SIZE: how many connections are kept open
+# - DB_MAX_OVERFLOW: how many extra connections may be opened temporarily under load
+# - DB_POOL_TIMEOUT: how many seconds to wait for a free connection before giving up
+# - DB_POOL_PRE_PING: whether to check that a connection still works before using it, so that
+#   connections dropped by the server or the network don’t surface as errors
+# - DB_POOL_RECYCLE: how many seconds a connection is used before it is replaced (-1 for never)
+db = create_engine(
+    os.environ['DB_URL'],
+    pool_size=env_int('DB_POOL_SIZE', 5),
+    max_overflow=env_int('DB_MAX_OVERFLOW', 10),
+    pool_timeout=env_int('DB_POOL_TIMEOUT', 30),
+    pool_pre_ping=env_flag('DB_POOL_PRE_PING', True),
+    pool_recycle=env_int('DB_POOL_RECYCLE', 1800))
+
+metadata = MetaData()
+
+
+# Reflection (having SQLAlchemy read a table’s definition from the database itself) costs a
+# round trip to the database. Rather than doing that as soon as this module is imported, we
+# reflect each table the first time it is actually needed and remember the result.
+@functools.lru_cache(maxsize=None)
+def reflected_table(name):
+    return Table(name, metadata, autoload_with=db)
+
+
+def movie_rating_stats_table():
+    return reflected_table('movie_rating_stats')
+
+
+# Helper function for the batch functions below: `column == any_(id_array(ids))` becomes `column = ANY(:ids)`, with
+# all of the IDs sent as a single array parameter. The statement is the same no matter how many IDs there are, unlike
+# `IN (:id_1, :id_2, ...)`.
+def id_array(ids):
+    return literal(list(ids), ARRAY(Integer))
+
+
+# Helper function for matching text literally within an ILIKE pattern: the pattern characters `%` and `_`
+# (and the escape character itself) must be escaped.
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# The statement and parameters for `search_movies_by_title`, which netflix_dal_async.py runs as well.
+def title_search_statement(query, limit, after):
+    parameters = {'pattern': f'%{escape_like(query)}%', 'limit': limit}
+    keyset = ''
+    if after is not None:
+        keyset = 'AND (title, id) > (:after_title, :after_id)'
+        parameters['after_title'], parameters['after_id'] = after
+
+    return (text(f"""
+        SELECT * FROM movie
+        WHERE title ILIKE :pattern {keyset}
+        ORDER BY title, id
+        LIMIT :limit
+    """), parameters)
 
 
 # Raw SQL-style implementation of a movie query.
-def search_movies_by_title(query, limit=100):
+#
+# The query is sent _separately_ from the SQL as a bound parameter (`:pattern`), rather than pasted into the SQL
+# string, so no title query can change the meaning of the statement. The substring match is served by the trigram
+# index created in ../migrations/001_movie_title_trigram_index.sql instead of a scan of every movie.
+#
+# For paging, pass the (title, id) of the last movie from the previous page as `after`. The next page then starts
+# right after it in index order (“keyset” pagination), so page 100 costs the same as page 1—unlike OFFSET, which
+# has to find and skip every earlier row.
+@cached
+def search_movies_by_title(query, limit=100, after=None):
+    with db.connect() as connection:
+        result_set = connection.execute(*title_search_statement(query, limit, after))
+        result = result_set.fetchall()
+        return list(result)
+
+
+# Also raw SQL-style: titles ranked by how similar they are to the query (per pg_trgm), best first—handy for
+# autocomplete and typo-tolerant search. The `%` operator keeps only titles above pg_trgm’s similarity threshold
+# and is served by the same trigram index.
+#
+# Rows have the movie’s columns followed by its `score`. For the next page, pass the (score, id) of the last movie
+# from the previous page as `after`.
+@cached
+def search_movies_by_similarity(query, limit=100, after=None):
     with db.connect() as connection:
-        # We want actual %'s so need to escape them in the string.
-        result_set = connection.execute(f"""
-            SELECT * FROM movie WHERE title ILIKE '%%{query}%%' ORDER BY title LIMIT {limit}
-        """)
+        parameters = {'query': query, 'limit': limit}
+        keyset = ''
+        if after is not None:
+            keyset = 'AND (similarity(title, :query) < :after_score OR ' + \
+                '(similarity(title, :query) = :after_score AND id > :after_id))'
+            parameters['after_score'], parameters['after_id'] = after
+
+        result_set = connection.execute(text(f"""
+            SELECT *, similarity(title, :query) AS score FROM movie
+            WHERE title % :query {keyset}
+            ORDER BY score DESC, id
+            LIMIT :limit
+        """), parameters)
         result = result_set.fetchall()
         return list(result)
 
 
 # SQL builder-style implementation of an aggregate query.
+#
+# Rather than averaging over every one of the movie’s ratings, this reads the movie’s one row in the
+# `movie_rating_stats` summary table (see ../migrations/002_movie_rating_stats.sql), which triggers keep up to date
+# as ratings come and go. The average is then just the sum of the ratings divided by their count.
+@cached
 def get_average_rating_of_movie(movie_id):
     with db.connect() as connection:
-        statement = select([func.avg(rating_table.c.rating)]).where(rating_table.c.movie_id == movie_id)
+        stats = movie_rating_stats_table()
+        statement = select([stats.c.rating_sum, stats.c.rating_count]).where(stats.c.movie_id == movie_id)
         result_set = connection.execute(statement)
 
-        # We know in advance that this will be a single row with a single column so we feel safe about hardcoding this.
-        # A non-existent movie will yield `None` for this expression.
-        return result_set.fetchone()[0]
+        # A non-existent (or unrated) movie will have no summary row, or a count of zero, and yields `None`.
+        row = result_set.fetchone()
+        if row is None or row.rating_count == 0:
+            return None
+
+        return row.rating_sum / row.rating_count
+
+
+# Batch version of `get_average_rating_of_movie`: one query for any number of movies, returning a dictionary from
+# each given movie ID to its average rating (`None` for non-existent or unrated movies). The summary table already
+# holds each movie’s “GROUP BY movie_id” totals, so all that’s left is picking out the requested rows.
+def get_average_ratings_of_movies(movie_ids):
+    averages = {movie_id: None for movie_id in movie_ids}
+    if not averages:
+        return averages
+
+    with db.connect() as connection:
+        stats = movie_rating_stats_table()
+        statement = select([stats.c.movie_id, stats.c.rating_sum, stats.c.rating_count]).\
+            where(stats.c.movie_id == any_(id_array(averages)))
+
+        for row in connection.execute(statement):
+            if row.rating_count > 0:
+                averages[row.movie_id] = row.rating_sum / row.rating_count
+
+        return averages
+
+
+# Recomputes every movie’s rating summary from the ratings themselves. This is for after bulk loads that bypass
+# the summary triggers (see rebuild_rating_stats.py); normal inserts keep the summaries current on their own.
+def rebuild_movie_rating_stats():
+    with db.begin() as connection:
+        connection.execute(text('SELECT rebuild_movie_rating_stats()'))
 
 
 # For ORM-style implementations, we need to define a few things first.
@@ -61,30 +201,123 @@ class Rating(ORM_Base):
 
 
 # The notion of a Session is a multifaceted one whose usage and implementation may change depending on the type
-# of application that is using this DAL (particularly, a standalone application vs. a web service). It is implemented
-# here in the simplest possible way. Note that if this DAL is to be used in other contexts, code surrounding sessions
-# may have to change.
+# of application that is using this DAL (particularly, a standalone application vs. a web service).
 #
-# At a minimum, we follow the basic SQLAlchemy rule that sessions should be external to the functions that use them.
-# Thus, we define current_session at this upper level, and not within each function.
-Session = sessionmaker(bind=db)
-current_session = Session()
+# We follow the basic SQLAlchemy rule that sessions should be external to the functions that use them. A single
+# global session, however, can’t be shared safely by the threads of a web service. So we use a `scoped_session`:
+# calling `Session()` returns a session that belongs to the current thread, created on first use. A web service
+# should call `end_session` when it finishes handling each request, so that the next request starts fresh and the
+# session’s connection goes back to the pool. A standalone program can simply exit.
+Session = scoped_session(sessionmaker(bind=db))
+
+
+def end_session():
+    Session.remove()
+
+
+# Helper functions for paging: a cursor is the position of the last rating on a page, encoded as an opaque string.
+# Callers just hand it back to get the next page.
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+
+# Helper functions for `get_ratings_page_by_viewer`, which netflix_dal_async.py uses as well: the statement that
+# selects a page (plus one more rating, which tells us whether there is a next page), and the page that it yields.
+def ratings_page_statement(viewer_id, limit, cursor):
+    # We are already joining with Movie, so `contains_eager` fills in each rating’s `movie` from that join,
+    # rather than issuing one more query per rating when the caller accesses `rating.movie`.
+    statement = select(Rating).\
+        join(Rating.movie).\
+        options(contains_eager(Rating.movie)).\
+        where(Rating.viewer_id == viewer_id)
+
+    if cursor is not None:
+        date_rated, title, movie_id = decode_cursor(cursor)
+        statement = statement.where(tuple_(Rating.date_rated, Movie.title, Movie.id) >
+            tuple_(datetime.date.fromisoformat(date_rated), title, movie_id))
+
+    return statement.\
+        order_by(Rating.date_rated, Movie.title, Movie.id).\
+        limit(limit + 1)
 
 
-# ORM-style implementation of a rating query.
+def ratings_page(ratings, limit):
+    if len(ratings) <= limit:
+        return (ratings, None)
+
+    last = ratings[limit - 1]
+    return (ratings[:limit], encode_cursor([last.date_rated.isoformat(), last.movie.title, last.movie.id]))
+
+
+# ORM-style implementation of a rating query, one page at a time. Returns the page’s ratings along with a cursor for
+# the next page, or `None` if this is the last page.
+#
+# The ratings are ordered by (date_rated, title, movie ID)—the movie ID breaks ties between same-titled movies rated
+# on the same day. The cursor holds those values for the page’s last rating, and the next page asks for ratings that
+# come _after_ it in that order (a “keyset” condition) rather than skipping rows with OFFSET. With the index from
+# ../migrations/003_rating_viewer_index.sql, page 100 then costs about the same as page 1.
+def get_ratings_page_by_viewer(viewer_id, limit=100, cursor=None):
+    ratings = Session().execute(ratings_page_statement(viewer_id, limit, cursor)).scalars().all()
+    return ratings_page(ratings, limit)
+
+
+# The first page of a viewer’s ratings.
 def get_ratings_by_viewer(viewer_id, limit=100):
-    query = current_session.query(Rating).\
+    ratings, _ = get_ratings_page_by_viewer(viewer_id, limit)
+    return ratings
+
+
+# Batch version of `get_ratings_by_viewer`: one query for any number of viewers, returning a dictionary from each
+# given viewer ID to that viewer’s ratings (up to `limit` each, in the same order as `get_ratings_by_viewer`).
+#
+# A plain LIMIT would apply to all of the viewers together, so instead a window function numbers each viewer’s
+# ratings separately—`row_number() OVER (PARTITION BY viewer_id ...)`—and we keep the ones numbered up to `limit`.
+def get_ratings_by_viewers(viewer_ids, limit=100):
+    ratings = {viewer_id: [] for viewer_id in viewer_ids}
+    if not ratings:
+        return ratings
+
+    session = Session()
+    numbered = session.query(
+            Rating.movie_id,
+            Rating.viewer_id,
+            func.row_number().over(
+                partition_by=Rating.viewer_id,
+                order_by=(Rating.date_rated, Movie.title, Movie.id)).label('position')).\
+        join(Movie).\
+        filter(Rating.viewer_id == any_(id_array(ratings))).\
+        subquery()
+
+    query = session.query(Rating).\
         join(Movie).\
-        filter(Rating.viewer_id == viewer_id).\
-        order_by(Rating.date_rated, Movie.title).\
-        limit(limit)
+        join(numbered, and_(Rating.movie_id == numbered.c.movie_id, Rating.viewer_id == numbered.c.viewer_id)).\
+        options(contains_eager(Rating.movie)).\
+        filter(numbered.c.position <= limit).\
+        order_by(Rating.viewer_id, numbered.c.position)
 
-    return query.all()
+    for rating in query:
+        ratings[rating.viewer_id].append(rating)
+
+    return ratings
 
 
 # ORM-style implementation of a movie inserter.
+#
+# A new movie can show up in title searches (and has an average rating of `None`, not whatever was cached for
+# its ID before), so adding one empties those caches.
+@invalidates(search_movies_by_title, search_movies_by_similarity, get_average_rating_of_movie)
 def insert_movie(title, year):
+    session = Session()
     movie = Movie(title=title, year=year)
-    current_session.add(movie)
-    current_session.commit() # Make the change permanent.
+    session.add(movie)
+    try:
+        session.commit() # Make the change permanent.
+    except:
+        session.rollback() # Leave the session usable for the next call.
+        raise
+
     return movie
@@ -0,0 +1,120 @@
+"""
+This module is the asyncio counterpart of netflix_dal.py: the same functions with the same results, but written as
+`async def` functions for programs that run on an event loop, such as an aiohttp web service. While one call waits
+for the database, the loop is free to run others, so a single process can have thousands of lookups in flight
+without a thread for each.
+
+It runs on SQLAlchemy’s asyncio extension with the _asyncpg_ driver, and uses the same `DB_URL` (and pool settings)
+as netflix_dal.py—the driver part of the URL is switched to asyncpg automatically. The statements themselves come
+from netflix_dal.py, so the two modules always ask the same questions.
+"""
+
+import asyncio
+import os
+import re
+
+from sqlalchemy import column, table
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.sql import select
+
+import netflix_dal
+from dal_cache import cached, invalidates
+from netflix_dal import Movie, env_flag, env_int, ratings_page, ratings_page_statement, title_search_statement
+
+
+# `postgresql://...` (or `postgresql+psycopg2://...`, and so on) becomes `postgresql+asyncpg://...`.
+def async_url(url):
+    return re.sub(r'^postgres(ql)?(\+\w+)?://', 'postgresql+asyncpg://', url)
+
+
+# Like netflix_dal.py’s engine, this one keeps a pool of connections; a call waits for a free one when all of them
+# are busy. For thousands of concurrent callers, it’s the pool size—not the number of callers—that determines how
+# many queries the database sees at once.
+db = create_async_engine(
+    async_url(os.environ['DB_URL']),
+    pool_size=env_int('DB_POOL_SIZE', 5),
+    max_overflow=env_int('DB_MAX_OVERFLOW', 10),
+    pool_timeout=env_int('DB_POOL_TIMEOUT', 30),
+    pool_pre_ping=env_flag('DB_POOL_PRE_PING', True),
+    pool_recycle=env_int('DB_POOL_RECYCLE', 1800))
+
+
+# A program should call this before its event loop ends, so that the pooled connections are closed properly.
+async def close():
+    await db.dispose()
+
+
+# Table reflection is a synchronous affair, so the summary table is described here instead—just the columns that
+# we use.
+movie_rating_stats = table('movie_rating_stats', column('movie_id'), column('rating_sum'), column('rating_count'))
+
+
+# The cached functions use the same caches as their netflix_dal.py counterparts, which return the same results.
+# A program that uses both modules thus looks each result up only once, and `insert_movie` in either module
+# empties the caches for both.
+@cached(cache=netflix_dal.search_movies_by_title.cache)
+async def search_movies_by_title(query, limit=100, after=None):
+    async with db.connect() as connection:
+        result_set = await connection.execute(*title_search_statement(query, limit, after))
+        return list(result_set.fetchall())
+
+
+@cached(cache=netflix_dal.get_average_rating_of_movie.cache)
+async def get_average_rating_of_movie(movie_id):
+    async with db.connect() as connection:
+        statement = select([movie_rating_stats.c.rating_sum, movie_rating_stats.c.rating_count]).\
+            where(movie_rating_stats.c.movie_id == movie_id)
+        result_set = await connection.execute(statement)
+
+        row = result_set.fetchone()
+        if row is None or row.rating_count == 0:
+            return None
+
+        return row.rating_sum / row.rating_count
+
+
+# An asyncio program has no natural “current thread” to tie a session to, so each call gets a session of its own.
+# `expire_on_commit=False` keeps the returned objects readable after their session has closed.
+def new_session():
+    return AsyncSession(db, expire_on_commit=False)
+
+
+async def get_ratings_page_by_viewer(viewer_id, limit=100, cursor=None):
+    async with new_session() as session:
+        result = await session.execute(ratings_page_statement(viewer_id, limit, cursor))
+        return ratings_page(result.scalars().all(), limit)
+
+
+async def get_ratings_by_viewer(viewer_id, limit=100):
+    ratings, _ = await get_ratings_page_by_viewer(viewer_id, limit)
+    return ratings
+
+
+@invalidates(search_movies_by_title, netflix_dal.search_movies_by_similarity, get_average_rating_of_movie)
+async def insert_movie(title, year):
+    async with new_session() as session:
+        movie = Movie(title=title, year=year)
+        session.add(movie)
+        await session.commit() # Leaving the `async with` rolls back if this fails.
+        return movie
+
+
+DEFAULT_CONCURRENCY = 100
+
+
+async def gather_by_id(function, ids, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Calls `function` (one of the functions above) for every ID in `ids`, concurrently, and returns a dictionary from
+    each ID to its result—for example, `await gather_by_id(get_average_rating_of_movie, movie_ids)`. No more than
+    `concurrency` calls are in progress at once, so that one large batch doesn’t claim every pooled connection while
+    other callers wait.
+    """
+    ids = list(ids)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(id):
+        async with semaphore:
+            return await function(id)
+
+    results = await asyncio.gather(*(call(id) for id in ids))
+    return dict(zip(ids, results))
@@ -0,0 +1,14 @@
+"""
+This program recomputes the per-movie rating summaries in `movie_rating_stats` from the
+`rating` table. The summaries normally keep themselves current, but a bulk load done with the
+rating triggers disabled—or a `TRUNCATE`—leaves them behind, and this catches them up.
+"""
+
+import time
+
+from netflix_dal import rebuild_movie_rating_stats
+
+print('Rebuilding movie rating statistics...')
+start = time.perf_counter()
+rebuild_movie_rating_stats()
+print(f'Done in {time.perf_counter() - start:.1f}s.')
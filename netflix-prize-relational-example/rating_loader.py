@@ -1,7 +1,3 @@
-import csv
-import re
-import sys
-
 """
 This program generates direct SQL statements from the source Netflix Prize files in order
 to populate a relational database with those files’ data.
@@ -9,34 +5,119 @@ to populate a relational database with those files’ data.
 By taking the approach of emitting SQL statements directly, we bypass the need to import
 some kind of database library for the loading process, instead passing the statements
 directly into a database command line utility such as `psql`.
+
+One `INSERT` per rating is the most portable approach, but also the slowest: 100 million
+statements each have to be parsed, planned, and committed on their own. PostgreSQL’s `COPY`
+command is built for bulk loading instead, so this program can also emit `COPY` data:
+
+- `--format copy` emits PostgreSQL’s text `COPY` format (tab-separated values), preceded by
+  the `COPY` command itself, so it can still be piped straight into `psql`
+- `--format binary` emits PostgreSQL’s binary `COPY` format, which the server can load with no
+  text parsing at all; since `psql` can’t embed binary data in a script, the `COPY` command
+  goes on the `psql` command line instead:
+
+      python3 rating_loader.py --format binary | psql <database URL> -c "COPY rating FROM STDIN (FORMAT binary)"
 """
 
-# For simplicity, we assume that the program runs where the files are located.
-RATING_SOURCES = [
-    'combined_data_1.txt',
-    'combined_data_2.txt',
-    'combined_data_3.txt',
-    'combined_data_4.txt'
-]
-
-# The all-important pattern indicating the current movie.
-MOVIE_LINE_PATTERN = '^(\d+):$'
-MOVIE_LINE = re.compile(MOVIE_LINE_PATTERN)
-
-current_movie_id = None
-
-# Read the files line by line and write them out as INSERT statements along with the current movie ID.
-for ratings_file in RATING_SOURCES:
-    with open(ratings_file, 'r+') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            movie_match = MOVIE_LINE.match(row[0])
-            if movie_match:
-                # Set the new movie ID.
-                current_movie_id = movie_match.group(1)
-            else:
-                # Write out an INSERT statement for the row.
-                viewer_id = int(row[0])
-                rating = int(row[1])
-                rating_date = row[2]
-                print(f'INSERT INTO rating VALUES({current_movie_id}, {viewer_id}, {rating}, \'{rating_date}\');')
+import argparse
+import datetime
+import functools
+import struct
+import sys
+
+from bulk_sql import add_batching_arguments, after_load, before_load, insert_statements
+from combined_data import add_workers_argument, map_chunks, rating_columns, read_movies, read_ratings
+
+COPY_COMMAND = 'COPY rating (movie_id, viewer_id, rating, date_rated) FROM STDIN;\n'
+COPY_END = '\\.\n'
+
+# Binary COPY begins with a fixed signature, a 32-bit flags field, and a 32-bit header
+# extension length, and ends with a 16-bit -1. In between, each row is a 16-bit field count
+# followed by every field’s 32-bit length and value. All numbers are big-endian.
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+BINARY_TRAILER = struct.pack('>h', -1)
+BINARY_ROW = struct.Struct('>hiiiiiiii')  # 4 fields: movie_id, viewer_id, rating (INT), date_rated (DATE)
+
+# PostgreSQL stores dates as days since January 1, 2000.
+POSTGRES_EPOCH = datetime.date(2000, 1, 1)
+
+
+@functools.lru_cache(maxsize=None)
+def postgres_day(date_rated):
+    return (datetime.date.fromisoformat(date_rated) - POSTGRES_EPOCH).days
+
+
+# Turn one chunk of the files into INSERT statements along with the current movie ID. Each
+# chunk is self-contained: its last batch and transaction end where the chunk does.
+def sql_statements(batch_size, commit_every, chunk):
+    values = (
+        f'({movie_id}, {viewer_id}, {rating}, \'{rating_date}\')'
+        for movie_id, viewer_id, rating, rating_date in read_ratings(chunk)
+    )
+
+    return insert_statements('rating', values, batch_size, commit_every)
+
+
+# Turn one chunk of the files into text COPY rows. The rating lines only need their commas
+# turned into tabs and the movie ID in front, so that’s all we do.
+def copy_text(chunk):
+    rows = []
+    for movie_id, rating_lines in read_movies(chunk):
+        if rating_lines:
+            prefix = f'{movie_id}\t'
+            rows.append(prefix)
+            rows.append(f'\n{prefix}'.join(rating_lines).replace(',', '\t'))
+            rows.append('\n')
+
+    return ''.join(rows)
+
+
+# Turn one chunk of the files into binary COPY rows.
+def copy_binary(chunk):
+    rows = []
+    pack = BINARY_ROW.pack
+    for movie_id, rating_lines in read_movies(chunk):
+        viewer_ids, ratings, dates = rating_columns(rating_lines)
+        rows.extend(
+            pack(4, 4, movie_id, 4, viewer_id, 4, rating, 4, day)
+            for viewer_id, rating, day in zip(viewer_ids, ratings, map(postgres_day, dates))
+        )
+
+    return b''.join(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prints SQL (or COPY data) that loads the combined_data ratings.')
+    parser.add_argument('--format', choices=['sql', 'copy', 'binary'], default='sql',
+        help='sql emits INSERT statements; copy and binary emit PostgreSQL COPY data (default: sql)')
+    add_batching_arguments(parser)
+    add_workers_argument(parser)
+    args = parser.parse_args()
+
+    if args.format == 'binary' and (args.unlogged or args.drop_indexes):
+        parser.error('--unlogged and --drop-indexes emit SQL, which cannot be mixed into binary COPY data')
+
+    if args.format != 'binary':
+        sys.stdout.write(before_load('rating', args.unlogged, args.drop_indexes))
+
+    # Chunks come back in file order, so the rows print in the same order either way.
+    if args.format == 'binary':
+        output = sys.stdout.buffer
+        output.write(BINARY_HEADER)
+        for rows in map_chunks(copy_binary, args.workers):
+            output.write(rows)
+
+        output.write(BINARY_TRAILER)
+    elif args.format == 'copy':
+        sys.stdout.write(COPY_COMMAND)
+        for rows in map_chunks(copy_text, args.workers):
+            sys.stdout.write(rows)
+
+        sys.stdout.write(COPY_END)
+    else:
+        sql_function = functools.partial(sql_statements, args.batch_size, args.commit_every)
+        for statements in map_chunks(sql_function, args.workers):
+            sys.stdout.write(statements)
+
+    if args.format != 'binary':
+        sys.stdout.write(after_load('rating', args.unlogged, args.drop_indexes))